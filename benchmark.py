@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from instance_generator import write_instance
+from genetic_operations import generate_random_solution, selection_tournament, select_tournament, select_roulette, \
+    cross, cross_pairs, mutation
+from storage_data import FLOSolution, LOADED_INSTANCES
+from traning_center import evolve_generation
+
+BENCHMARK_FOLDER = "benchmarks"
+INSTANCES = {
+    "easy": (os.path.join("dane", "easy_flow.json"), os.path.join("dane", "easy_cost.json"), 3, 3),
+    "flat": (os.path.join("dane", "flat_flow.json"), os.path.join("dane", "flat_cost.json"), 12, 1),
+    "hard": (os.path.join("dane", "hard_flow.json"), os.path.join("dane", "hard_cost.json"), 5, 6),
+}
+# name: number of machines, board x, board y, share of pairs with a non zero flow
+SYNTHETIC_INSTANCES = {
+    "synthetic_50": (50, 8, 8, 0.3),
+    "synthetic_100": (100, 12, 12, 0.1),
+    "synthetic_1000": (1000, 36, 36, 0.005),
+}
+POPULATION_SIZES = [100, 1000, 10000]
+# throughput metrics, higher is better. Every other metric is a time or a size where lower is better
+THROUGHPUT_METRICS = {"evaluations_per_second", "generations_per_second"}
+
+
+def instance_files(name: str, folder: str = BENCHMARK_FOLDER) -> tuple[str, str, int, int]:
+    if name in INSTANCES:
+        return INSTANCES[name]
+    number_of_machines, x_board_size, y_board_size, density = SYNTHETIC_INSTANCES[name]
+    return write_instance(os.path.join(folder, "instances"), name, number_of_machines, density,
+                          board_size=(x_board_size, y_board_size), include_zero_flows=number_of_machines <= 100,
+                          seed=0)
+
+
+def best_time(function, repeat: int) -> float:
+    # fastest of repeat runs, each on fresh state built by function itself when it needs one
+    times = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def seeded(value: int):
+    genetic_operations.seed(value)
+    np.random.seed(value)
+
+
+def run_generations(solution: FLOSolution, number_of_generations: int) -> FLOSolution:
+    # the tournament training loop without writing results, parents drawn per child pair
+    last_solutions = []
+    for i in range(number_of_generations):
+        solution.sort_chromosomes_by_score()
+        last_solutions.append(solution.best_score)
+        if len(last_solutions) > 10:
+            last_solutions.pop(0)
+        solution = evolve_generation(solution, last_solutions, "t", 0.3, 8, 0.9, 0.1, True)
+    return solution
+
+
+def benchmark_case(instance: str, number_of_chromosomes: int, seed: int = 0, repeat: int = 3,
+                   number_of_generations: int = 10) -> dict:
+    flow_name, cost_name, x_board_size, y_board_size = instance_files(instance)
+    result = {}
+    LOADED_INSTANCES.clear()
+    result["load_seconds"] = best_time(lambda: FLOSolution(flow_name, cost_name, x_board_size, y_board_size), 1)
+
+    seeded(seed)
+    result["generate_seconds"] = best_time(
+        lambda: generate_random_solution(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes),
+        repeat)
+    seeded(seed)
+    solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes)
+
+    # full evaluation of the population, bypassing the fitness cache
+    seconds = best_time(lambda: solution.calculate_population_scores(solution.population), repeat)
+    result["fitness_seconds"] = seconds
+    result["evaluations_per_second"] = number_of_chromosomes / seconds
+    solution.sort_chromosomes_by_score()
+    scores = solution.calculate_scores()
+
+    seeded(seed)
+    result["selection_tournament_seconds"] = best_time(lambda: selection_tournament(solution, 0.1, 2), repeat)
+    result["select_tournament_seconds"] = best_time(
+        lambda: select_tournament(scores, (number_of_chromosomes, 2), 0.1), repeat)
+    result["select_roulette_seconds"] = best_time(lambda: select_roulette(scores, (number_of_chromosomes, 2)), repeat)
+
+    seeded(seed)
+    parents = selection_tournament(solution, 0.1, 2)
+    pairs = select_tournament(scores, (number_of_chromosomes, 2), 0.1)
+    result["cross_seconds"] = best_time(lambda: cross(solution, parents, 1.0), repeat)
+    result["cross_pairs_seconds"] = best_time(lambda: cross_pairs(solution, pairs, 1.0), repeat)
+
+    def mutate():
+        mutated = solution.next_generation()
+        mutated.population = solution.population.copy()
+        mutated.scores = scores.copy()
+        mutation(mutated, 0.3, 8)
+
+    seeded(seed)
+    result["mutation_seconds"] = best_time(mutate, repeat)
+
+    seeded(seed)
+    seconds = best_time(lambda: run_generations(solution, number_of_generations), 1)
+    result["generation_seconds"] = seconds / number_of_generations
+    result["generations_per_second"] = number_of_generations / seconds
+
+    seeded(seed)
+    tracemalloc.start()
+    run_generations(solution, number_of_generations)
+    result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result
+
+
+def run_benchmarks(instances: Optional[list[str]] = None, population_sizes: Optional[list[int]] = None,
+                   seed: int = 0, repeat: int = 3, number_of_generations: int = 10) -> dict:
+    instances = instances if instances is not None else list(INSTANCES) + list(SYNTHETIC_INSTANCES)
+    population_sizes = population_sizes if population_sizes is not None else POPULATION_SIZES
+    results = {}
+    for instance in instances:
+        for number_of_chromosomes in population_sizes:
+            key = f"{instance}/{number_of_chromosomes}"
+            print(f"Benchmark {key}")
+            results[key] = benchmark_case(instance, number_of_chromosomes, seed, repeat, number_of_generations)
+    return {"date": datetime.now().isoformat(sep=" ", timespec="seconds"), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "seed": seed, "repeat": repeat,
+            "generations": number_of_generations, "results": results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.1) -> list[str]:
+    """
+    Regressions of current against baseline: throughput more than tolerance lower, times and memory more than
+    tolerance higher. Cases or metrics missing from either run are skipped.
+    """
+    regressions = []
+    for key, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            base = baseline["results"].get(key, {}).get(metric)
+            if not base or not value:
+                continue
+            if metric in THROUGHPUT_METRICS:
+                change = base / value - 1
+            else:
+                change = value / base - 1
+            if change > tolerance:
+                regressions.append(f"{key} {metric}: {base:.6g} -> {value:.6g} ({change * 100:+.1f}% worse)")
+    return regressions
+
+
+def print_results(results: dict):
+    print("case;evaluations/s;generations/s;fitness ms;cross ms;mutation ms;peak MB")
+    for key, e in results["results"].items():
+        print(f"{key};{e['evaluations_per_second']:.0f};{e['generations_per_second']:.2f};"
+              f"{e['fitness_seconds'] * 1000:.3f};{e['cross_seconds'] * 1000:.3f};{e['mutation_seconds'] * 1000:.3f};"
+              f"{e['peak_memory_bytes'] / 2 ** 20:.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks fitness, operators and whole generations")
+    parser.add_argument("--instances", nargs="*", help=f"default {list(INSTANCES) + list(SYNTHETIC_INSTANCES)}")
+    parser.add_argument("--sizes", nargs="*", type=int, help=f"population sizes, default {POPULATION_SIZES}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--output", default=os.path.join(BENCHMARK_FOLDER, "benchmark.json"))
+    parser.add_argument("--baseline", help="json of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--save-baseline", action="store_true", help="also store this run as the baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.instances, args.sizes, args.seed, args.repeat, args.generations)
+    print_results(results)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+    baseline_name = args.baseline if args.baseline is not None else os.path.join(BENCHMARK_FOLDER, "baseline.json")
+    if args.save_baseline:
+        with open(baseline_name, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    elif os.path.exists(baseline_name):
+        with open(baseline_name, "r", encoding="utf-8") as input_file:
+            regressions = compare(results, json.load(input_file), args.tolerance)
+        for e in regressions:
+            print(f"REGRESSION {e}")
+        print(f"{len(regressions)} regressions against {baseline_name}")
+        sys.exit(1 if regressions else 0)
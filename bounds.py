@@ -0,0 +1,151 @@
+import itertools
+import math
+from typing import Optional
+
+import numpy as np
+
+from run_statistics import optimality_gap
+from storage_data import FLOSolution, Population, CELL_DTYPE
+
+# tiny boards with at most this many layouts without overlaps are enumerated instead of bounded
+EXACT_MAX_LAYOUTS = 2000000
+EXACT_BATCH_SIZE = 100000
+# (instance hash, board x, board y): (lower bound, whether it is the optimum)
+LOWER_BOUNDS: dict[tuple[str, int, int], tuple[int, bool]] = {}
+
+
+def linear_assignment(cost: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Hungarian method (shortest augmenting paths with potentials) for a rows x columns cost matrix with
+    rows <= columns. Returns the rows and the columns assigned to them with the least total cost.
+    """
+    number_of_rows, number_of_columns = cost.shape
+    if number_of_rows > number_of_columns:
+        raise ValueError(f"Can not assign {number_of_rows} rows to {number_of_columns} columns")
+    cost = cost.astype(np.float64)
+    # index 0 is the virtual column the augmenting path starts from, rows are stored 1-based in assigned
+    u = np.zeros(number_of_rows + 1)
+    v = np.zeros(number_of_columns + 1)
+    assigned = np.zeros(number_of_columns + 1, dtype=np.int64)
+    way = np.zeros(number_of_columns + 1, dtype=np.int64)
+    for row in range(1, number_of_rows + 1):
+        assigned[0] = row
+        column = 0
+        min_values = np.full(number_of_columns + 1, np.inf)
+        used = np.zeros(number_of_columns + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = assigned[column]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            better = ~used[1:] & (reduced < min_values[1:])
+            min_values[1:][better] = reduced[better]
+            way[1:][better] = column
+            candidates = np.where(used[1:], np.inf, min_values[1:])
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            u[assigned[used]] += delta
+            v[used] -= delta
+            min_values[~used] -= delta
+            column = next_column
+            if assigned[column] == 0:
+                break
+        while column != 0:
+            previous = way[column]
+            assigned[column] = assigned[previous]
+            column = previous
+    columns = np.flatnonzero(assigned[1:])
+    rows = assigned[columns + 1] - 1
+    order = np.argsort(rows)
+    return rows[order], columns[order]
+
+
+def cell_distances(board_size_x: int, board_size_y: int) -> np.ndarray:
+    cells = np.arange(board_size_x * board_size_y)
+    return np.abs(cells[:, None] % board_size_x - cells[None, :] % board_size_x) + \
+        np.abs(cells[:, None] // board_size_x - cells[None, :] // board_size_x)
+
+
+def gilmore_lawler_bound(solution: FLOSolution) -> int:
+    """
+    Gilmore-Lawler bound of the layouts without overlaps. Placing machine i on cell k costs at least the smallest
+    product of its flow weights (largest first) with the Manhattan distances from k to the other cells (shortest
+    first). The cheapest assignment of machines to cells under these costs counts every pair from both ends.
+    """
+    number_of_machines = solution.instance.number_of_machines
+    distances = np.sort(cell_distances(solution.board_size_x, solution.board_size_y), axis=1)[:, 1:]
+    weights = solution.weights
+    degrees = np.diff(weights.indptr)
+    sorted_weights = np.zeros((number_of_machines, max(int(degrees.max(initial=0)), 1)), dtype=np.int64)
+    for machine in range(number_of_machines):
+        machine_weights = weights.neighbours(machine)[1]
+        sorted_weights[machine, :len(machine_weights)] = np.sort(machine_weights)[::-1]
+    placement_costs = sorted_weights @ distances[:, :sorted_weights.shape[1]].T
+    rows, columns = linear_assignment(placement_costs)
+    return (int(placement_costs[rows, columns].sum()) + 1) // 2
+
+
+def overlap_bound(solution: FLOSolution, overlap_penelty: int = 10000) -> int:
+    # a layout with o overlapping pairs pays the penalty o times, every other pair is at least 1 apart
+    weights = np.sort(solution.weights.weights)[::-1]
+    if len(weights) == 0:
+        return overlap_penelty
+    overlaps = np.arange(1, len(weights) + 1)
+    return int((overlap_penelty * overlaps + weights.sum() - np.cumsum(weights)).min())
+
+
+def number_of_layouts(solution: FLOSolution) -> int:
+    return math.perm(solution.board_size_x * solution.board_size_y, solution.instance.number_of_machines)
+
+
+def exact_optimum(solution: FLOSolution, max_layouts: int = EXACT_MAX_LAYOUTS) -> Optional[tuple[int, np.ndarray]]:
+    """
+    Best score and layout among all layouts without overlaps, None when there are more than max_layouts of them.
+    """
+    number_of_machines = solution.instance.number_of_machines
+    if number_of_layouts(solution) > max_layouts:
+        return None
+    layouts = itertools.permutations(range(solution.board_size_x * solution.board_size_y), number_of_machines)
+    best_score, best_cells = None, None
+    while True:
+        batch = np.fromiter(itertools.chain.from_iterable(itertools.islice(layouts, EXACT_BATCH_SIZE)),
+                            dtype=CELL_DTYPE).reshape(-1, number_of_machines)
+        if len(batch) == 0:
+            return best_score, best_cells
+        scores = solution.calculate_population_scores(Population(solution.board_size_x, solution.board_size_y,
+                                                                 batch))
+        best = int(np.argmin(scores))
+        if best_score is None or scores[best] < best_score:
+            best_score, best_cells = int(scores[best]), batch[best].copy()
+
+
+def lower_bound(solution: FLOSolution, max_layouts: int = EXACT_MAX_LAYOUTS) -> tuple[int, bool]:
+    """
+    Lower bound of the score of every layout of the instance and board of solution, overlaps included, and whether
+    it is the optimum. Boards with at most max_layouts layouts without overlaps are solved by enumeration, the
+    others bounded by gilmore_lawler_bound. Computed once per instance and board.
+    """
+    key = (solution.instance.content_hash, solution.board_size_x, solution.board_size_y)
+    if key in LOWER_BOUNDS:
+        return LOWER_BOUNDS[key]
+    number_of_machines = solution.instance.number_of_machines
+    number_of_cells = solution.board_size_x * solution.board_size_y
+    if number_of_machines > number_of_cells:
+        # every machine beyond the number of cells shares its cell with at least one other
+        result = (10000 * (number_of_machines - number_of_cells), False)
+    else:
+        exact = exact_optimum(solution, max_layouts)
+        bound = exact[0] if exact is not None else gilmore_lawler_bound(solution)
+        with_overlaps = overlap_bound(solution)
+        result = (bound, exact is not None) if bound <= with_overlaps else (with_overlaps, False)
+    LOWER_BOUNDS[key] = result
+    return result
+
+
+def reached_target(best_score: int, bound: int, target_gap: float) -> bool:
+    return best_score <= bound or optimality_gap(best_score, bound) <= target_gap
+
+
+if __name__ == '__main__':
+    for name, x_board_size, y_board_size in [("easy", 3, 3), ("flat", 12, 1), ("hard", 5, 6)]:
+        solution = FLOSolution(f"dane\\{name}_flow.json", f"dane\\{name}_cost.json", x_board_size, y_board_size)
+        print(name, lower_bound(solution))
@@ -0,0 +1,102 @@
+import json
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from storage_data import FLOSolution, Population, CELL_DTYPE
+
+CHECKPOINT_MAGIC = b"FLOCKPT\0"
+CHECKPOINT_VERSION = 1
+# magic, version, header length
+PREFIX = struct.Struct("<8sII")
+ALIGNMENT = 64
+
+
+def checkpoint_path(folder: str, id=0) -> str:
+    return os.path.join(folder, "checkpoints", f"{id}.ckpt")
+
+
+def get_rng_state() -> dict:
+    version, internal_state, gauss = genetic_operations.random.getstate()
+    return {"random": [version, list(internal_state), gauss],
+            "numpy": genetic_operations.rng.bit_generator.state}
+
+
+def set_rng_state(state: dict):
+    version, internal_state, gauss = state["random"]
+    genetic_operations.random.setstate((version, tuple(internal_state), gauss))
+    genetic_operations.rng = np.random.default_rng()
+    genetic_operations.rng.bit_generator.state = state["numpy"]
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_checkpoint(solution: FLOSolution, file_name: str, config: Optional[dict] = None,
+                     last_solutions: Optional[list[int]] = None):
+    """
+    Saves the population, scores, generation, random generator state and config of a run. The file is written
+    next to file_name and renamed over it, so a crash never leaves a half written checkpoint behind.
+    Layout: magic, version, json header length, json header, population cells and scores at aligned offsets.
+    """
+    cells = solution.population.cells
+    scores = solution.calculate_scores()
+    header = {"generation": solution.generation, "best_score": solution.best_score,
+              "board_size_x": solution.board_size_x, "board_size_y": solution.board_size_y,
+              "number_of_chromosomes": solution.number_of_chromosomes, "shape": list(cells.shape),
+              "last_solutions": list(last_solutions or []), "rng": get_rng_state(), "config": config or {}}
+    encoded = json.dumps(header).encode("utf-8")
+    cells_offset = _aligned(PREFIX.size + len(encoded))
+    scores_offset = _aligned(cells_offset + cells.nbytes)
+
+    os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+    temporary_name = file_name + ".tmp"
+    with open(temporary_name, "wb") as file:
+        file.write(PREFIX.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, len(encoded)))
+        file.write(encoded)
+        file.seek(cells_offset)
+        file.write(np.ascontiguousarray(cells, dtype=CELL_DTYPE).tobytes())
+        file.seek(scores_offset)
+        file.write(np.ascontiguousarray(scores, dtype=np.int64).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_name, file_name)
+
+
+def read_checkpoint_header(file_name: str) -> dict:
+    with open(file_name, "rb") as file:
+        magic, version, header_length = PREFIX.unpack(file.read(PREFIX.size))
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError(f"{file_name} is not a checkpoint")
+        if version > CHECKPOINT_VERSION:
+            raise ValueError(f"Checkpoint version {version} of {file_name} is newer than {CHECKPOINT_VERSION}")
+        header = json.loads(file.read(header_length).decode("utf-8"))
+    header["cells_offset"] = _aligned(PREFIX.size + header_length)
+    return header
+
+
+def read_checkpoint(file_name: str, flow_name: str, cost_name: str,
+                    restore_rng: bool = True) -> tuple[FLOSolution, dict]:
+    """
+    Loads a checkpoint written by write_checkpoint. The population is memory mapped copy-on-write, so resuming
+    does not read the whole array up front and the file itself is never modified.
+    """
+    header = read_checkpoint_header(file_name)
+    shape = tuple(header["shape"])
+    cells_offset = header["cells_offset"]
+    scores_offset = _aligned(cells_offset + shape[0] * shape[1] * np.dtype(CELL_DTYPE).itemsize)
+
+    solution = FLOSolution(flow_name, cost_name, header["board_size_x"], header["board_size_y"],
+                           header["number_of_chromosomes"], header["generation"], header["best_score"])
+    if shape[0] > 0:
+        cells = np.memmap(file_name, dtype=CELL_DTYPE, mode="c", offset=cells_offset, shape=shape)
+        solution.population = Population(header["board_size_x"], header["board_size_y"], cells)
+        solution.scores = np.array(np.memmap(file_name, dtype=np.int64, mode="r", offset=scores_offset,
+                                             shape=(shape[0],)))
+    if restore_rng:
+        set_rng_state(header["rng"])
+    return solution, header
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import numpy as np
+
+from local_search import neighbourhood_deltas
+from parallel_evaluation import ParallelEvaluator
+from storage_data import FLOSolution, Population, CELL_DTYPE
+
+INSTANCES = {
+    "easy": (os.path.join("dane", "easy_flow.json"), os.path.join("dane", "easy_cost.json"), 3, 3),
+    "flat": (os.path.join("dane", "flat_flow.json"), os.path.join("dane", "flat_cost.json"), 12, 1),
+    "hard": (os.path.join("dane", "hard_flow.json"), os.path.join("dane", "hard_cost.json"), 5, 6),
+}
+
+
+def random_layouts(rng: np.random.Generator, solution: FLOSolution, number_of_layouts: int) -> Population:
+    # half of the layouts without overlaps, the other half with cells drawn independently so most overlap
+    number_of_machines = solution.max_id() + 1
+    number_of_cells = solution.board_size_x * solution.board_size_y
+    distinct = np.argsort(rng.random((number_of_layouts // 2, number_of_cells)), axis=1)[:, :number_of_machines]
+    overlapping = rng.integers(number_of_cells, size=(number_of_layouts - len(distinct), number_of_machines))
+    return Population(solution.board_size_x, solution.board_size_y,
+                      np.concatenate([distinct, overlapping]).astype(CELL_DTYPE))
+
+
+def check_instance(name: str, number_of_layouts: int = 200, seed: int = 0) -> list[str]:
+    """
+    Differences between the ways a layout is scored: the per connection sum of the chromosome objects, the batched
+    calculate_population_scores, move_cost/swap_cost/neighbourhood_deltas against scoring the changed layout and
+    the ParallelEvaluator against the serial scores. An empty list when all of them agree exactly.
+    """
+    flow_name, cost_name, x_board_size, y_board_size = INSTANCES[name]
+    rng = np.random.default_rng(seed)
+    solution = FLOSolution(flow_name, cost_name, x_board_size, y_board_size)
+    population = random_layouts(rng, solution, number_of_layouts)
+    scores = solution.calculate_population_scores(population)
+    errors = []
+    edge_rows = np.repeat(np.arange(solution.weights.number_of_machines), np.diff(solution.weights.indptr))
+    for k, cells in enumerate(population.cells):
+        expected = solution.calculate_sum_cost(population.chromosome(k))
+        if scores[k] != expected:
+            errors.append(f"{name} layout {k}: batched {scores[k]} per connection {expected}")
+        cost = int(scores[k])
+        grid = population.occupancy(k)
+        free_cells = grid.free_cells()
+        machine = int(rng.integers(len(cells)))
+        swaps, moves = neighbourhood_deltas(solution, cells, grid, machine, free_cells, edge_rows)
+        for other in range(len(cells)):
+            swapped = cells.copy()
+            swapped[machine], swapped[other] = cells[other], cells[machine]
+            expected = solution.calculate_layout_cost(swapped)
+            if solution.swap_cost(cells, cost, machine, other) != expected or cost + swaps[other] != expected:
+                errors.append(f"{name} layout {k}: swap {machine}<->{other} does not give {expected}")
+        for new_cell in range(population.number_of_cells):
+            moved = cells.copy()
+            moved[machine] = new_cell
+            expected = solution.calculate_layout_cost(moved)
+            if solution.move_cost(cells, cost, machine, new_cell, grid.counts) != expected:
+                errors.append(f"{name} layout {k}: move {machine}->{new_cell} does not give {expected}")
+        for i, new_cell in enumerate(free_cells.tolist()):
+            moved = cells.copy()
+            moved[machine] = new_cell
+            if cost + moves[i] != solution.calculate_layout_cost(moved):
+                errors.append(f"{name} layout {k}: local search move {machine}->{new_cell} is wrong")
+
+    with ParallelEvaluator(flow_name, cost_name, x_board_size, y_board_size, processes=2, threshold=1) as evaluator:
+        parallel = evaluator.evaluate(solution, population)
+    if not np.array_equal(parallel, scores):
+        errors.append(f"{name}: parallel scores differ in {int(np.count_nonzero(parallel != scores))} layouts")
+    return errors
+
+
+if __name__ == '__main__':
+    errors = []
+    for name in INSTANCES:
+        errors += check_instance(name)
+        print(f"{name} checked")
+    for e in errors:
+        print(e)
+    print(f"{len(errors)} differences")
+    sys.exit(1 if errors else 0)
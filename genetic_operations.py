@@ -1,36 +1,49 @@
+import bisect
+import os
 import random
-from typing import Union
+from typing import Union, Optional
 
-from storage_data import Chromosome, FLOSolution, FLOMachine
+import numpy as np
+
+import profiling
+from storage_data import Chromosome, FLOSolution, Population, FitnessCache, CELL_DTYPE
+
+
+rng = np.random.default_rng()
+
+
+def seed(value: Optional[int] = None):
+    global rng
+    random.seed(value)
+    rng = np.random.default_rng(value)
+
+
+# forked workers (pools, islands) would otherwise all continue the parent's stream, spawned ones import afresh
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=seed)
 
 
 def generate_random_positions(solution: FLOSolution, chromosome: Chromosome):
-    def check_if_position(x: int, y: int):
-        for L in chromosome.machines:
-            if L.posX == x and L.posY == y:
-                return True
-        return False
+    cells = np.empty(len(chromosome.machines), dtype=CELL_DTYPE)
+    generate_random_cells(solution, cells)
+    for e, cell in zip(chromosome.machines, cells.tolist()):
+        e.posX = cell % solution.board_size_x
+        e.posY = cell // solution.board_size_x
+
 
-    for e in chromosome.machines:
-        x = random.randrange(solution.board_size_x)
-        y = random.randrange(solution.board_size_y)
-        while check_if_position(x, y):
-            x = random.randrange(solution.board_size_x)
-            y = random.randrange(solution.board_size_y)
-        e.posX = x
-        e.posY = y
+def generate_random_cells(solution: FLOSolution, cells: np.ndarray):
+    # distinct free cells drawn directly, raises ValueError when there are more machines than cells
+    cells[:] = random.sample(range(solution.board_size_x * solution.board_size_y), k=len(cells))
 
 
 def generate_random_solution(paths_flow_file_name: str, paths_cost_file_name: str, board_size_x: int, board_size_y: int,
                              number_of_chromosomes: int = 10) -> FLOSolution:
     solution = FLOSolution(paths_flow_file_name, paths_cost_file_name, board_size_x, board_size_y,
                            number_of_chromosomes, 1)
-    max_id = solution.max_id()
-    for _ in range(number_of_chromosomes):
-        chromo = Chromosome([])
-        chromo.generate_machines(max_id)
-        generate_random_positions(solution, chromosome=chromo)
-        solution.chromosomes.append(chromo)
+    population = Population.empty(board_size_x, board_size_y, number_of_chromosomes, solution.max_id() + 1)
+    for cells in population.cells:
+        generate_random_cells(solution, cells)
+    solution.population = population
 
     # print(solution)
     # for c in solution.chromosomes:
@@ -41,35 +54,36 @@ def generate_random_solution(paths_flow_file_name: str, paths_cost_file_name: st
 old = {}
 
 
-def selection_tournament(solution: FLOSolution, sample_size: Union[int, float] = 5, number_of_results: int = 2) -> list[
-    Chromosome]:
-
+def selection_tournament(solution: FLOSolution, sample_size: Union[int, float] = 5,
+                         number_of_results: int = 2) -> Population:
+    population = solution.population
     if sample_size < 1.0:
-        sample_size = int(len(solution.chromosomes) * sample_size)
+        sample_size = int(len(population) * sample_size)
     if sample_size == 0:
-        return solution.chromosomes
+        return population
+    scores = solution.calculate_scores()
     all_chromosomes = []
 
     def inside(check):
         for e in all_chromosomes:
-            if e == check:
+            if np.array_equal(population.cells[e], population.cells[check]):
                 return True
         return False
 
     for i in range(number_of_results):
         chromo = None
-        selected_chromosomes = random.sample(solution.chromosomes, k=sample_size)
-        selected_chromosomes.sort(key=lambda d: solution.calculate_sum_cost(d))
+        selected_chromosomes = random.sample(range(len(population)), k=sample_size)
+        selected_chromosomes.sort(key=lambda d: scores[d])
         while chromo is None or inside(chromo):
             chromo = selected_chromosomes.pop(0)
 
         all_chromosomes.append(chromo)
 
     assert len(all_chromosomes) == number_of_results
-    return all_chromosomes
+    return population.take(all_chromosomes)
 
 
-def roulette(solution: FLOSolution, number_of_results: int = 2):
+def roulette(solution: FLOSolution, number_of_results: int = 2) -> Population:
     all_chromosomes = []
     solution.sort_chromosomes_by_score()
     # min = solution.calculate_sum_cost(solution.chromosomes[0])
@@ -77,7 +91,7 @@ def roulette(solution: FLOSolution, number_of_results: int = 2):
 
     # for e in solution.chromosomes:
     #     print(solution.calculate_sum_cost(e))
-    l = list(map(lambda d: solution.calculate_sum_cost(d), solution.chromosomes))
+    l = solution.scores.tolist()
     suma = sum(l)
     inverse_prob = list(map(lambda d: 1 / (d / suma), l))
     sum_inverse_prob = sum(inverse_prob)
@@ -88,7 +102,7 @@ def roulette(solution: FLOSolution, number_of_results: int = 2):
         """
         return (suma / val) ** 3
 
-    weights = list(map(lambda d: scale(solution.calculate_sum_cost(d)), solution.chromosomes))
+    weights = list(map(lambda d: scale(d), l))
     #  mi = min(weights)
     #  weights = list(map(lambda d: (d), weights))
     #   a = ""
@@ -99,12 +113,37 @@ def roulette(solution: FLOSolution, number_of_results: int = 2):
     for i in range(number_of_results):
         chromo = None
         while chromo is None or chromo in all_chromosomes:
-            return random.choices(solution.chromosomes, weights=weights, k=2)
+            return solution.population.take(random.choices(range(len(l)), weights=weights, k=2))
         all_chromosomes.append(chromo)
     assert len(all_chromosomes) == number_of_results
     return all_chromosomes
 
 
+# parents of a whole generation in one call, number_of_results can be a shape such as (number_of_chromosomes, 2)
+def select_tournament(scores: np.ndarray, number_of_results: Union[int, tuple[int, ...]],
+                      sample_size: Union[int, float] = 5) -> np.ndarray:
+    if sample_size < 1.0:
+        sample_size = int(len(scores) * sample_size)
+    sample_size = min(max(sample_size, 1), len(scores))
+    # contestants are drawn with replacement, the best of each sample wins
+    samples = rng.integers(len(scores), size=np.append(number_of_results, sample_size))
+    winners = np.argmin(scores[samples], axis=-1)
+    return np.take_along_axis(samples, winners[..., None], axis=-1)[..., 0]
+
+
+def select_roulette(scores: np.ndarray, number_of_results: Union[int, tuple[int, ...]]) -> np.ndarray:
+    # same cubic scaling as roulette()
+    weights = (scores.sum() / scores.astype(np.float64)) ** 3
+    return rng.choice(len(scores), size=number_of_results, p=weights / weights.sum())
+
+
+def select_rank(scores: np.ndarray, number_of_results: Union[int, tuple[int, ...]]) -> np.ndarray:
+    # linear ranking, the best layout weighs len(scores) and the worst 1
+    ranks = np.empty(len(scores), dtype=np.float64)
+    ranks[np.argsort(scores, kind="stable")] = np.arange(len(scores), 0, -1)
+    return rng.choice(len(scores), size=number_of_results, p=ranks / ranks.sum())
+
+
 def anydup(thelist):
     seen = set()
     for x in thelist:
@@ -114,124 +153,148 @@ def anydup(thelist):
 
 
 # prawdopodbienstwo krzyzowania
-def cross(solution: FLOSolution, parents_sample: list[Chromosome], cross_chance: float = 0.1,
-          number_of_cuts_per_chromosome: int = 1) -> FLOSolution:
+def cross(solution: FLOSolution, parents_sample: Union[Population, list[Chromosome]], cross_chance: float = 0.1,
+          number_of_cuts_per_chromosome: int = 1, repair_overlaps: bool = False) -> FLOSolution:
     next_generation = solution.next_generation()
-    next_generation.connections = solution.connections
-    total_rotations = 0
-    # next_generation.chromosomes.append(parent1)
-    # next_generation.chromosomes.append(parent2)
+    if not isinstance(parents_sample, Population):
+        parents_sample = Population.from_chromosomes(parents_sample, solution.board_size_x, solution.board_size_y)
 
     if random.random() > cross_chance:
-        for e in parents_sample:
-            next_generation.chromosomes.append(Chromosome(list(map(lambda d: d.copy(), e.machines))))
+        next_generation.population = parents_sample.copy()
         return next_generation
 
-    def fix_machines(list_machines: list[FLOMachine]):
-        source = random.choice(parents_sample)
-        machines_id_list = list(map(lambda d: d.machineId, list_machines))
-        machines_id_set = set(machines_id_list)
-        machines_indexes = list(map(lambda d: machines_id_list.index(d), machines_id_set))
-        list_mac = []
-        for i in machines_indexes:
-            list_mac.append(list_machines[i])
-        machines_id_list = list(map(lambda d: d.machineId, list_mac))
-        sources_id = list(map(lambda d: d.machineId, source.machines))
-        for i in range(solution.max_id() + 1):
-            if machines_id_list.count(i) == 0:
-                list_mac.append(source.machines[sources_id.index(i)])
-
-        assert len(list_mac) == len(parents_sample[0].machines)
-        assert len(list_mac) == solution.max_id() + 1
-        l = list(map(lambda d: d.machineId, list_mac))
-        assert len(set(l)) == len(l)
-
-        return list_mac
-
-    # print(list(map(lambda d: d.machineId, parent1.machines)))
-    # print(list(map(lambda d: d.machineId, parent2.machines)))
-
-    for _ in range(solution.number_of_chromosomes):
-        list_of_machines = []
-        for i in range(solution.max_id() + 1):
-            list_of_machines.append(random.choice(parents_sample)[i])
-
-        # parent1 = random.choice(parents_sample)
-        # parent2 = random.choice(parents_sample)
-        # random.shuffle(parent1.machines)
-        # random.shuffle(parent2.machines)
-        target_length = len(parents_sample[0].machines)
-        # last_cut_pos = random.randrange(target_length)
-        # list_of_machines: list = parent1.machines[0:last_cut_pos] + parent2.machines[last_cut_pos:]
-
-        # parent2_insert = True
-        # for i in range(number_of_cuts_per_chromosome):
-        #     remaining_length = target_length - len(list_of_machines)
-        #     if remaining_length <= 0:
-        #         break
-        #     cut_point = random.randrange(remaining_length)
-        #     if parent2_insert:
-        #         list_of_machines = list_of_machines + parent2.machines[last_cut_pos:]
-        #     else:
-        #         list_of_machines = list_of_machines + parent1.machines[last_cut_pos:]
-        #     last_cut_pos += cut_point
-        #     parent2_insert = not parent2_insert
-
-        # remaining_length = target_length - len(list_of_machines)
-        # # if parent2_insert:
-        # #     list_of_machines = list_of_machines + parent2.machines[last_cut_pos: last_cut_pos + remaining_length]
-        # # else:
-        # #     list_of_machines = list_of_machines + parent1.machines[last_cut_pos: last_cut_pos + remaining_length]
-
-        assert len(list_of_machines) == target_length and len(list_of_machines) == len(parents_sample[0].machines)
-        # assert not anydup(list(map(lambda d: d.machineId, list_of_machines)))
-        # print(list(map(lambda d: d.machineId, list_of_machines)))
-
-        list_of_machines_copy = list(map(lambda d: d.copy(), fix_machines(list_of_machines)))
-        next_generation.chromosomes.append(Chromosome(list_of_machines_copy))
+    next_generation.population = cross_population(parents_sample, solution.number_of_chromosomes, repair_overlaps)
+    return next_generation
+
 
+def cross_pairs(solution: FLOSolution, parent_indices: np.ndarray, cross_chance: float = 0.1,
+                repair_overlaps: bool = False) -> FLOSolution:
+    # parent_indices[i] are the rows of solution.population breeding child i, see select_tournament
+    next_generation = solution.next_generation()
+    if random.random() > cross_chance:
+        next_generation.population = solution.population.take(parent_indices[:, 0])
+        return next_generation
+    next_generation.population = cross_population(solution.population, len(parent_indices), repair_overlaps,
+                                                  parent_indices)
     return next_generation
 
 
-def mutation(solution: FLOSolution, mutation_chance: float = 0.1, number_of_mutations: int = 5):
-    for e in solution.chromosomes:
-        def get_overlaping(pos_x, pos_y):
-            for i in range(len(e.machines)):
-                machine1 = e.machines[i]
-                if machine1.posX == pos_x and machine1.posY == pos_y:
-                    return machine1
-            return None
+def cross_population(parents: Population, number_of_children: int, repair_overlaps: bool = False,
+                     parent_indices: Optional[np.ndarray] = None) -> Population:
+    # uniform crossover of the whole generation, every gene of every child comes from a random parent. The column
+    # index is the machine id so each machine ends up in the child exactly once and ids never need repairing
+    number_of_machines = parents.number_of_machines
+    if parent_indices is None:
+        choice = rng.integers(len(parents), size=(number_of_children, number_of_machines))
+    else:
+        picked = rng.integers(parent_indices.shape[1], size=(number_of_children, number_of_machines))
+        choice = np.take_along_axis(parent_indices, picked, axis=1)
+    children = Population(parents.board_size_x, parents.board_size_y,
+                          parents.cells[choice, np.arange(number_of_machines)])
+    if repair_overlaps:
+        repair_children(children)
+    return children
+
+
+def repair_children(children: Population):
+    # machines landing on a cell already taken by a lower id are moved to random free cells of their child
+    number_of_children, number_of_machines = children.cells.shape
+    number_of_cells = children.number_of_cells
+    if number_of_machines > number_of_cells or number_of_children == 0:
+        return
+    machine_ids = np.broadcast_to(np.arange(number_of_machines), children.cells.shape)
+    flat_cells = (children.cells + np.arange(number_of_children)[:, None] * number_of_cells).ravel()
+    owner = np.full(number_of_children * number_of_cells, number_of_machines)
+    np.minimum.at(owner, flat_cells, machine_ids.ravel())
+    displaced = (owner[flat_cells] != machine_ids.ravel()).reshape(children.cells.shape)
+    if not displaced.any():
+        return
+
+    keys = rng.random((number_of_children, number_of_cells))
+    keys[(owner != number_of_machines).reshape(number_of_children, number_of_cells)] = 2.0
+    free_cells = np.argsort(keys, axis=1)
+    rows, machines = np.nonzero(displaced)
+    profiling.profiler.count("repairs", len(rows))
+    rank = np.cumsum(displaced, axis=1)[rows, machines] - 1
+    children.cells[rows, machines] = free_cells[rows, rank]
+
 
+def mutation(solution: FLOSolution, mutation_chance: float = 0.1, number_of_mutations: int = 5):
+    population = solution.population
+    scores = solution.calculate_scores()
+    board_size_x, board_size_y = solution.board_size_x, solution.board_size_y
+    mutated = 0
+    for k, e in enumerate(population.cells):
         if random.random() < mutation_chance:
+            mutated += 1
             # print("We got mutation!")
+            # plain lists and ints, the scalar delta costs beat numpy calls on a handful of neighbours
+            layout = e.tolist()
+            counts = [0] * population.number_of_cells
+            # machines standing on every occupied cell, lowest id first
+            machines_at: dict[int, list[int]] = {}
+            for machine, cell in enumerate(layout):
+                machines_at.setdefault(cell, []).append(machine)
+                counts[cell] += 1
+            cost = int(scores[k])
+            for i in range(number_of_mutations):
+                random_machine = random.randrange(population.number_of_machines)
+                new_pos_x = random.randrange(board_size_x)
+                new_pos_y = random.randrange(board_size_y)
+                new_cell = new_pos_y * board_size_x + new_pos_x
+                old_cell = layout[random_machine]
+                if old_cell == new_cell:
+                    continue
+                old_machines = machines_at[old_cell]
+                old_machines.remove(random_machine)
+                if new_cell in machines_at:  # swap
+                    overlap = machines_at[new_cell].pop(0)
+                    cost = solution.swap_cost(layout, cost, random_machine, overlap)
+                    layout[overlap] = old_cell
+                    bisect.insort(old_machines, overlap)
+                else:
+                    cost = solution.move_cost(layout, cost, random_machine, new_cell, counts)
+                    counts[old_cell] -= 1
+                    counts[new_cell] += 1
+                    machines_at[new_cell] = []
+                    if not old_machines:
+                        del machines_at[old_cell]
+                layout[random_machine] = new_cell
+                bisect.insort(machines_at[new_cell], random_machine)
+            e[:] = layout
+            scores[k] = cost
+            solution.fitness_cache.put(FitnessCache.fingerprint(e), cost)
+    profiling.profiler.count("mutated_layouts", mutated)
+
+
+def mutate_population(population: Population, mutation_chance: float = 0.1, number_of_mutations: int = 5):
+    # the moves of mutation() without keeping scores, for layouts that are scored only after mutating
+    board_size_x, board_size_y = population.board_size_x, population.board_size_y
+    mutated = 0
+    for e in population.cells:
+        if random.random() < mutation_chance:
+            mutated += 1
+            layout = e.tolist()
             for i in range(number_of_mutations):
-                random_machine: FLOMachine = random.choice(e.machines)
-                new_pos_x = random.randrange(solution.board_size_x)
-                new_pos_y = random.randrange(solution.board_size_y)
-                overlap = get_overlaping(new_pos_x, new_pos_y)
-                if overlap is None:
-                    random_machine.posX = new_pos_x
-                    random_machine.posY = new_pos_y
-                else:  # swap
-                    overlap.posX = random_machine.posX
-                    overlap.posY = random_machine.posY
-                    random_machine.posX = new_pos_x
-                    random_machine.posY = new_pos_y
-
-                # movement = random.choice(e.machines)
-                # movement.posX += random.randrange(3)
-                # if movement.posX > solution.board_size_x:
-                #     movement.posX -= solution.board_size_x
-                # movement.posY += random.randrange(3)
-                # if movement.posY > solution.board_size_y:
-                #     movement.posY -= solution.board_size_y
+                random_machine = random.randrange(population.number_of_machines)
+                new_pos_x = random.randrange(board_size_x)
+                new_pos_y = random.randrange(board_size_y)
+                new_cell = new_pos_y * board_size_x + new_pos_x
+                old_cell = layout[random_machine]
+                if old_cell == new_cell:
+                    continue
+                if new_cell in layout:  # swap with the lowest id on the cell
+                    layout[layout.index(new_cell)] = old_cell
+                layout[random_machine] = new_cell
+            e[:] = layout
+    profiling.profiler.count("mutated_layouts", mutated)
 
 
 if __name__ == '__main__':
     solution2 = generate_random_solution("dane\\easy_flow.json", "dane\\easy_cost.json", 3, 3)
 
     a = roulette(solution2)
-    for e in a:
+    for e in a.cells:
         print(solution2.calculate_sum_cost(e))
 
     # b = cross(solution2, a[0], a[1])
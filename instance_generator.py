@@ -0,0 +1,90 @@
+import json
+import math
+import os
+from typing import Optional
+
+import numpy as np
+
+FLOW_DISTRIBUTIONS = ("uniform", "exponential", "zipf")
+
+
+def board_for(number_of_machines: int, free_share: float = 0.2) -> tuple[int, int]:
+    # smallest square-ish board leaving about free_share of the cells empty
+    cells = math.ceil(number_of_machines / (1 - free_share))
+    x_board_size = math.ceil(math.sqrt(cells))
+    return x_board_size, math.ceil(cells / x_board_size)
+
+
+def draw_amounts(rng: np.random.Generator, size: int, distribution: str, max_amount: int) -> np.ndarray:
+    if distribution == "uniform":
+        amounts = rng.integers(1, max_amount + 1, size)
+    elif distribution == "exponential":
+        # most flows small, a few close to max_amount
+        amounts = np.ceil(rng.exponential(max_amount / 8, size))
+    elif distribution == "zipf":
+        amounts = rng.zipf(2.0, size)
+    else:
+        raise ValueError(f"Unknown flow distribution {distribution}, expected one of {FLOW_DISTRIBUTIONS}")
+    return np.clip(amounts, 1, max_amount).astype(np.int64)
+
+
+def generate_instance(number_of_machines: int, density: float = 0.1, distribution: str = "uniform",
+                      max_amount: int = 100, max_cost: int = 20, include_zero_flows: bool = False,
+                      seed: Optional[int] = None) -> tuple[list[dict], list[dict]]:
+    """
+    Flow and cost entries in the dane/*.json schema. Every pair of machines has a flow with probability density,
+    amounts follow distribution, costs are uniform in 1..max_cost. With include_zero_flows every pair is listed
+    like in the dane/ files, pairs without flow having amount 0, otherwise only the flows are written, so the
+    files grow with the number of flows instead of the square of the number of machines.
+    """
+    rng = np.random.default_rng(seed)
+    sources, targets = [], []
+    for source in range(number_of_machines - 1):
+        # targets of source drawn directly, without a coin flip for every pair
+        number_of_targets = number_of_machines - source - 1
+        count = rng.binomial(number_of_targets, density)
+        targets.append(np.sort(rng.choice(number_of_targets, count, replace=False)) + source + 1)
+        sources.append(np.full(count, source))
+    sources = np.concatenate(sources) if sources else np.empty(0, dtype=np.int64)
+    targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.int64)
+    # the highest machine gets a flow so the instance has number_of_machines machines
+    if number_of_machines > 1 and (len(targets) == 0 or targets.max() < number_of_machines - 1):
+        sources = np.append(sources, rng.integers(number_of_machines - 1))
+        targets = np.append(targets, number_of_machines - 1)
+    amounts = draw_amounts(rng, len(sources), distribution, max_amount)
+
+    flows = dict(zip(zip(sources.tolist(), targets.tolist()), amounts.tolist()))
+    if include_zero_flows:
+        pairs = [(source, dest) for dest in range(number_of_machines) for source in range(dest)]
+    else:
+        pairs = sorted(flows, key=lambda d: (d[1], d[0]))
+    costs = rng.integers(1, max_cost + 1, len(pairs)).tolist()
+    flow = [{"source": source, "dest": dest, "amount": flows.get((source, dest), 0)} for source, dest in pairs]
+    cost = [{"source": source, "dest": dest, "cost": c} for (source, dest), c in zip(pairs, costs)]
+    return flow, cost
+
+
+def write_instance(folder: str, name: str, number_of_machines: int, density: float = 0.1,
+                   distribution: str = "uniform", board_size: Optional[tuple[int, int]] = None,
+                   seed: Optional[int] = None, **kwargs) -> tuple[str, str, int, int]:
+    """
+    Writes folder/{name}_flow.json and folder/{name}_cost.json, returns their names and the board size, by
+    default a board with about a fifth of the cells free.
+    """
+    x_board_size, y_board_size = board_size if board_size is not None else board_for(number_of_machines)
+    if x_board_size * y_board_size < number_of_machines:
+        raise ValueError(f"{number_of_machines} machines do not fit a {x_board_size}x{y_board_size} board")
+    flow, cost = generate_instance(number_of_machines, density, distribution, seed=seed, **kwargs)
+    os.makedirs(folder, exist_ok=True)
+    flow_name, cost_name = os.path.join(folder, f"{name}_flow.json"), os.path.join(folder, f"{name}_cost.json")
+    with open(flow_name, "w", encoding="utf-8") as output:
+        json.dump(flow, output, indent=2)
+    with open(cost_name, "w", encoding="utf-8") as output:
+        json.dump(cost, output, indent=2)
+    return flow_name, cost_name, x_board_size, y_board_size
+
+
+if __name__ == '__main__':
+    for number_of_machines, density in [(200, 0.05), (1000, 0.01), (5000, 0.002)]:
+        print(write_instance("dane\\generated", f"sparse_{number_of_machines}", number_of_machines, density,
+                             "exponential", seed=number_of_machines))
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import queue
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from genetic_operations import generate_random_solution
+from run_log import TextResultSink
+from storage_data import FitnessCache, FLOSolution
+from traning_center import RESULTS_FOLDER, evolve_generation, output_file_name
+
+TOPOLOGIES = ("ring", "full")
+
+
+def migration_targets(island_id: int, number_of_islands: int, topology: str = "ring") -> list[int]:
+    if topology == "ring":
+        return [(island_id + 1) % number_of_islands] if number_of_islands > 1 else []
+    if topology == "full":
+        return [i for i in range(number_of_islands) if i != island_id]
+    raise ValueError(f"Unknown migration topology {topology}, expected one of {TOPOLOGIES}")
+
+
+def run_island(island_id: int, flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+               number_of_chromosomes: int, method: str, mutation_chance: float, number_of_mutations: int,
+               sample_size: float, cross_chance: float, max_generations: int, migration_interval: int,
+               number_of_migrants: int, topology: str, inboxes: list, reports, seed: Optional[int] = None):
+    # islands are independent: a seed per island, otherwise fresh entropy also on platforms spawning processes
+    genetic_operations.seed(seed + island_id if seed is not None else None)
+    number_of_islands = len(inboxes)
+    targets = migration_targets(island_id, number_of_islands, topology)
+    incoming = sum(island_id in migration_targets(i, number_of_islands, topology) for i in range(number_of_islands))
+
+    current_solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size,
+                                                number_of_chromosomes)
+    last_solutions = []
+    while current_solution.generation <= max_generations:
+        current_solution.sort_chromosomes_by_score()
+        last_solutions.append(current_solution.best_score)
+        if len(last_solutions) > 10:
+            last_solutions.pop(0)
+        generation = current_solution.generation
+        best_cells = None
+        if generation % 10 == 0 or generation == max_generations:
+            best_cells = current_solution.population.cells[0].tolist()
+        reports.put((island_id, generation, current_solution.best_score, best_cells))
+
+        if generation % migration_interval == 0 and generation < max_generations and targets:
+            migrants = (current_solution.population.cells[:number_of_migrants].copy(),
+                        current_solution.scores[:number_of_migrants].copy())
+            for target in targets:
+                inboxes[target].put(migrants)
+            # every island migrates on the same generations, so all sends happen before anyone waits here
+            received = [inboxes[island_id].get() for _ in range(incoming)]
+            cells = np.concatenate([e[0] for e in received])[:len(current_solution.population) - 1]
+            scores = np.concatenate([e[1] for e in received])[:len(cells)]
+            if len(cells) > 0:
+                # the population is sorted, immigrants replace the worst layouts
+                current_solution.population.cells[-len(cells):] = cells
+                current_solution.scores[-len(cells):] = scores
+                for e, score in zip(cells, scores.tolist()):
+                    current_solution.fitness_cache.put(FitnessCache.fingerprint(e), score)
+
+        current_solution = evolve_generation(current_solution, last_solutions, method, mutation_chance,
+                                             number_of_mutations, cross_chance, sample_size)
+
+
+def start_training_with_islands(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                                number_of_chromosomes: int,
+                                number_of_cuts_per_chromosome: int, mutation_chance: float, number_of_mutations: int,
+                                sample_size: float, cross_chance: float, max_generations: int, method: str = "t",
+                                number_of_islands: Optional[int] = None, migration_interval: int = 10,
+                                number_of_migrants: int = 2, topology: str = "ring",
+                                results_folder: str = RESULTS_FOLDER, id=0, seed: Optional[int] = None,
+                                result_sink=TextResultSink):
+    """
+    One layout search split into number_of_islands sub-populations of number_of_chromosomes each, every island is a
+    separate process. Every migration_interval generations each island sends its number_of_migrants best layouts to
+    the islands given by topology ("ring" or "full"). The best score over all islands is written per generation in
+    the format of start_training_with_roulette/_tournament.
+    """
+    if number_of_islands is None:
+        number_of_islands = os.cpu_count()
+    migration_targets(0, number_of_islands, topology)
+    file_name = output_file_name(method, x_board_size, y_board_size, number_of_chromosomes, mutation_chance,
+                                 number_of_mutations, cross_chance, max_generations, sample_size,
+                                 f"_islands_{number_of_islands}", result_sink.EXTENSION)
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(number_of_islands)]
+    reports = context.Queue()
+    islands = [context.Process(target=run_island, daemon=True,
+                               args=(i, flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes,
+                                     method, mutation_chance, number_of_mutations, sample_size, cross_chance,
+                                     max_generations, migration_interval, number_of_migrants, topology, inboxes,
+                                     reports, seed))
+               for i in range(number_of_islands)]
+    for island in islands:
+        island.start()
+
+    # generation -> [number of islands reported, best score, best layout]
+    pending: dict[int, list] = {}
+    generation = 1
+    best_score = None
+    number_of_machines = FLOSolution(flow_name, cost_name, x_board_size, y_board_size).max_id() + 1
+    with result_sink(os.path.join(results_folder, file_name)) as output:
+        output.start(x_board_size, y_board_size, number_of_machines)
+        while generation <= max_generations:
+            try:
+                island_id, island_generation, score, cells = reports.get(timeout=1)
+            except queue.Empty:
+                if any(island.exitcode not in (None, 0) for island in islands):
+                    for island in islands:
+                        island.terminate()
+                    raise RuntimeError("Island process failed")
+                continue
+            entry = pending.setdefault(island_generation, [0, None, None])
+            entry[0] += 1
+            if entry[1] is None or score < entry[1]:
+                entry[1] = score
+                entry[2] = cells
+            while generation in pending and pending[generation][0] == number_of_islands:
+                _, best_score, cells = pending.pop(generation)
+                if cells is not None:
+                    print(f"GENERATION {generation} islands {number_of_islands} Best Solution: {best_score}")
+                    cells = np.array(cells)
+                output.write(generation, best_score, cells)
+                generation += 1
+
+    for island in islands:
+        island.join()
+    print(f"Finished training at generation {max_generations} with score {best_score}")
+    with open(os.path.join(results_folder, "finished", f"{id}.finished"), "w") as out:
+        out.close()
+
+
+if __name__ == '__main__':
+    start_training_with_islands("dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, 200, 1, 0.3, 8, 0.2, 0.9, 1000,
+                                results_folder="hard\\tournament")
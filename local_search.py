@@ -0,0 +1,117 @@
+import time
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from storage_data import FLOSolution, FitnessCache, OccupancyGrid
+
+
+def neighbourhood_deltas(solution: FLOSolution, cells: np.ndarray, grid: OccupancyGrid, machine: int,
+                         free_cells: np.ndarray, edge_rows: np.ndarray,
+                         overlap_penelty: int = 10000) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Cost changes of swapping machine with every other machine and of moving it to each of free_cells, the same
+    values swap_cost and move_cost give one at a time. edge_rows is the row of every entry of the weights csr.
+    """
+    distances = solution._distances
+    weights = solution.weights
+    cells = cells.astype(np.int64)
+    cell = cells[machine]
+    neighbours, neighbour_weights = weights.neighbours(machine)
+    neighbour_cells = cells[neighbours]
+    before = distances(cell, neighbour_cells)
+
+    # machine on the cell of every other machine, the pair itself keeps its distance
+    swaps = (distances(cells[:, None], neighbour_cells[None, :]) - before) @ neighbour_weights
+    swaps[neighbours] += neighbour_weights * distances(cell, cells[neighbours])
+    # every other machine on the cell of machine, summed over the edges of the csr
+    other_cells = cells[weights.indices]
+    change = weights.data * (distances(cell, other_cells) -
+                             distances(cells[edge_rows], other_cells))
+    change[weights.indices == machine] = 0
+    swaps += np.bincount(edge_rows, change, minlength=len(cells)).astype(np.int64)
+    swaps[cells == cell] = 0
+
+    moves = (distances(free_cells[:, None], neighbour_cells[None, :]) - before) @ neighbour_weights
+    moves = moves - overlap_penelty * (int(grid.counts[cell]) - 1)
+    return swaps, moves
+
+
+def improve_layout(solution: FLOSolution, cells: np.ndarray, cost: int, max_evaluations: int = 10000,
+                   deadline: Optional[float] = None) -> tuple[int, int]:
+    """
+    First-improvement descent of one layout (changed in place) over swaps of two machines and moves of a machine
+    to a free cell. Machines are visited in random order, the first improving neighbour in random order is taken.
+    Stops in a local optimum, after max_evaluations evaluated neighbours or at deadline (time.perf_counter()).
+    Returns the new cost and the number of evaluated neighbours.
+    """
+    number_of_machines = len(cells)
+    grid = OccupancyGrid(cells, solution.population.number_of_cells)
+    weights = solution.weights
+    edge_rows = np.repeat(np.arange(weights.number_of_machines), np.diff(weights.indptr))
+    evaluations = 0
+    improved = True
+    while improved:
+        improved = False
+        for machine in genetic_operations.rng.permutation(number_of_machines).tolist():
+            if evaluations >= max_evaluations or (deadline is not None and time.perf_counter() > deadline):
+                return cost, evaluations
+            free_cells = grid.free_cells()
+            swaps, moves = neighbourhood_deltas(solution, cells, grid, machine, free_cells, edge_rows)
+            evaluations += number_of_machines - 1 + len(free_cells)
+            deltas = np.concatenate([swaps, moves])
+            candidates = np.flatnonzero(deltas < 0)
+            if len(candidates) == 0:
+                continue
+            chosen = int(genetic_operations.rng.choice(candidates))
+            if chosen < number_of_machines:
+                grid.swap(machine, chosen)
+            else:
+                grid.move(machine, int(free_cells[chosen - number_of_machines]))
+            cost += int(deltas[chosen])
+            improved = True
+    return cost, evaluations
+
+
+class LocalSearch:
+    """
+    Memetic stage of the training loops: every `every` generations the top best layouts of the sorted population
+    are improved by improve_layout, sharing max_evaluations neighbour evaluations and max_seconds of wall time.
+    Pass it as local_search to start_training_with_roulette/_tournament.
+    """
+
+    def __init__(self, every: int = 10, top: int = 1, max_evaluations: int = 20000,
+                 max_seconds: Optional[float] = None):
+        self.every = every
+        self.top = top
+        self.max_evaluations = max_evaluations
+        self.max_seconds = max_seconds
+
+    def due(self, generation: int) -> bool:
+        return self.every > 0 and generation % self.every == 0
+
+    def apply(self, solution: FLOSolution) -> int:
+        # returns how many of the layouts improved, the population is sorted again afterwards
+        solution.sort_chromosomes_by_score()
+        deadline = time.perf_counter() + self.max_seconds if self.max_seconds is not None else None
+        budget = self.max_evaluations
+        improved = 0
+        seen = set()
+        for row in range(min(self.top, len(solution.population))):
+            if budget <= 0 or (deadline is not None and time.perf_counter() > deadline):
+                break
+            cells = solution.population.cells[row]
+            key = FitnessCache.fingerprint(cells)
+            # copies of an already improved layout would only repeat the same descent
+            if key in seen:
+                continue
+            seen.add(key)
+            cost, evaluations = improve_layout(solution, cells, int(solution.scores[row]), budget, deadline)
+            budget -= evaluations
+            if cost < solution.scores[row]:
+                improved += 1
+                solution.scores[row] = cost
+                solution.fitness_cache.put(FitnessCache.fingerprint(cells), cost)
+        solution.sort_chromosomes_by_score()
+        return improved
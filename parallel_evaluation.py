@@ -0,0 +1,93 @@
+import os
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from storage_data import FLOSolution, Population, CELL_DTYPE
+
+# per worker process state, filled once by init_worker
+worker_solution: Optional[FLOSolution] = None
+worker_memory: dict[str, SharedMemory] = {}
+
+
+def init_worker(flow_name: str, cost_name: str, board_size_x: int, board_size_y: int):
+    global worker_solution
+    worker_solution = FLOSolution(flow_name, cost_name, board_size_x, board_size_y)
+
+
+def attach(*names: str) -> list[SharedMemory]:
+    # blocks released by the evaluator are closed here too, only the current ones stay mapped
+    for name in [e for e in worker_memory if e not in names]:
+        worker_memory.pop(name).close()
+    for name in names:
+        if name not in worker_memory:
+            worker_memory[name] = SharedMemory(name=name)
+    return [worker_memory[name] for name in names]
+
+
+def evaluate_slice(cells_name: str, scores_name: str, shape: tuple[int, int], start: int, stop: int):
+    cells_memory, scores_memory = attach(cells_name, scores_name)
+    cells = np.ndarray(shape, dtype=CELL_DTYPE, buffer=cells_memory.buf)
+    scores = np.ndarray(shape[0], dtype=np.int64, buffer=scores_memory.buf)
+    population = Population(worker_solution.board_size_x, worker_solution.board_size_y, cells[start:stop])
+    scores[start:stop] = worker_solution.calculate_population_scores(population)
+
+
+class ParallelEvaluator:
+    """
+    Scores populations of at least threshold layouts on a persistent pool of processes. Each worker loads the
+    flow/cost instance once, the layouts and scores are exchanged through shared memory.
+    Set it as FLOSolution.evaluator (or pass it to the training loops), smaller populations are scored serially.
+    """
+
+    def __init__(self, flow_name: str, cost_name: str, board_size_x: int, board_size_y: int,
+                 processes: Optional[int] = None, threshold: int = 2000):
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.threshold = threshold
+        # workers have to share the tracker of this process, otherwise a worker exiting unlinks the blocks it attached
+        resource_tracker.ensure_running()
+        self.pool = Pool(self.processes, initializer=init_worker,
+                         initargs=(flow_name, cost_name, board_size_x, board_size_y))
+        self.cells_memory: Optional[SharedMemory] = None
+        self.scores_memory: Optional[SharedMemory] = None
+
+    def _reserve(self, number_of_chromosomes: int, number_of_machines: int):
+        cells_size = max(1, number_of_chromosomes * number_of_machines * np.dtype(CELL_DTYPE).itemsize)
+        if self.cells_memory is None or self.cells_memory.size < cells_size:
+            self._release()
+            # blocks are grown with headroom and reused between generations
+            self.cells_memory = SharedMemory(create=True, size=cells_size * 2)
+            self.scores_memory = SharedMemory(create=True, size=max(1, number_of_chromosomes) * 8 * 2)
+
+    def _release(self):
+        for memory in (self.cells_memory, self.scores_memory):
+            if memory is not None:
+                memory.close()
+                memory.unlink()
+        self.cells_memory = None
+        self.scores_memory = None
+
+    def evaluate(self, solution: FLOSolution, population: Population) -> np.ndarray:
+        if len(population) < self.threshold:
+            return solution.calculate_population_scores(population)
+        shape = population.cells.shape
+        self._reserve(*shape)
+        cells = np.ndarray(shape, dtype=CELL_DTYPE, buffer=self.cells_memory.buf)
+        cells[:] = population.cells
+        step = -(-shape[0] // self.processes)
+        self.pool.starmap(evaluate_slice, [(self.cells_memory.name, self.scores_memory.name, shape, start,
+                                            min(start + step, shape[0])) for start in range(0, shape[0], step)])
+        return np.ndarray(shape[0], dtype=np.int64, buffer=self.scores_memory.buf).copy()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,185 @@
+import json
+import os
+import time
+import tracemalloc
+from typing import Optional
+
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class NullProfiler:
+    """
+    Profiler used while profiling is off, every hook returns immediately.
+    """
+    enabled = False
+
+    def phase(self, name: str):
+        return NULL_PHASE
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def end_generation(self, generation: int, solution=None):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class Phase:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.profiler.add_phase(self.name, self.started, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    """
+    Per generation timings of the training phases and counters, written to file_name at the end of every
+    generation. Phases may nest (fitness runs inside sort), so their times do not add up to the generation time.
+    trace_format "jsonl" writes one record per generation, "chrome" a trace for chrome://tracing or Perfetto with
+    every phase as a span and the counters as counter tracks. By default the format follows the extension, .jsonl
+    or .json. memory traces allocations with tracemalloc, the current and peak traced size go into every record
+    and the top allocation sites every snapshot_every generations.
+    """
+    enabled = True
+
+    def __init__(self, file_name: str, trace_format: Optional[str] = None, memory: bool = False,
+                 snapshot_every: int = 0):
+        self.trace_format = trace_format if trace_format is not None else \
+            ("jsonl" if file_name.endswith(".jsonl") else "chrome")
+        self.file = open(file_name, "w", encoding="utf-8")
+        self.memory = memory
+        self.snapshot_every = snapshot_every
+        self.phases: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+        self.origin = time.perf_counter_ns()
+        self.generation_started = self.origin
+        self.pid = os.getpid()
+        self.events = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        if self.trace_format == "chrome":
+            self.file.write("[\n")
+        self.started_tracing = memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def add_phase(self, name: str, started: int, stopped: int):
+        self.phases[name] = self.phases.get(name, 0) + stopped - started
+        if self.trace_format == "chrome":
+            self.event({"name": name, "ph": "X", "ts": (started - self.origin) / 1000,
+                        "dur": (stopped - started) / 1000, "pid": self.pid, "tid": 0})
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def event(self, event: dict):
+        self.file.write((",\n" if self.events else "") + json.dumps(event))
+        self.events += 1
+
+    def end_generation(self, generation: int, solution=None):
+        now = time.perf_counter_ns()
+        if solution is not None:
+            # the cache outlives the generation, only its growth belongs to this one
+            cache = solution.fitness_cache
+            if cache.hits >= self.cache_hits and cache.misses >= self.cache_misses:
+                self.count("cache_hits", cache.hits - self.cache_hits)
+                self.count("cache_misses", cache.misses - self.cache_misses)
+            self.cache_hits, self.cache_misses = cache.hits, cache.misses
+        record = {"generation": generation, "seconds": (now - self.generation_started) / 1e9,
+                  "phases": {k: v / 1e9 for k, v in self.phases.items()}, "counters": self.counters}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record["memory"] = {"current": current, "peak": peak}
+            tracemalloc.reset_peak()
+            if self.snapshot_every > 0 and generation % self.snapshot_every == 0:
+                statistics = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                record["memory"]["top"] = [{"line": str(e.traceback), "size": e.size, "count": e.count}
+                                           for e in statistics]
+
+        if self.trace_format == "jsonl":
+            self.file.write(json.dumps(record) + "\n")
+        else:
+            ts = (now - self.origin) / 1000
+            self.event({"name": "generation", "ph": "X", "ts": (self.generation_started - self.origin) / 1000,
+                        "dur": (now - self.generation_started) / 1000, "pid": self.pid, "tid": 1,
+                        "args": {"generation": generation}})
+            if self.counters:
+                self.event({"name": "counters", "ph": "C", "ts": ts, "pid": self.pid, "args": self.counters})
+            if self.memory:
+                self.event({"name": "memory", "ph": "C", "ts": ts, "pid": self.pid,
+                            "args": {"current": record["memory"]["current"], "peak": record["memory"]["peak"]}})
+        self.phases = {}
+        self.counters = {}
+        self.generation_started = time.perf_counter_ns()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.trace_format == "chrome":
+            self.file.write("\n]\n")
+        self.file.close()
+        if self.started_tracing:
+            tracemalloc.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stop_profiling()
+
+
+# the profiler of this process, hooks in the training code report to it
+profiler = NullProfiler()
+
+
+def start_profiling(file_name: str, trace_format: Optional[str] = None, memory: bool = False,
+                    snapshot_every: int = 0) -> Profiler:
+    global profiler
+    profiler.close()
+    profiler = Profiler(file_name, trace_format, memory, snapshot_every)
+    return profiler
+
+
+def profile_run(file_name: Optional[str], memory: bool = False):
+    """
+    Profiler for a with block around one run, profiling is switched off again when the block ends.
+    Without file_name the block leaves the current profiler alone.
+    """
+    if file_name is None:
+        return NullProfiler()
+    return start_profiling(file_name, memory=memory)
+
+
+def stop_profiling():
+    global profiler
+    profiler.close()
+    profiler = NullProfiler()
@@ -0,0 +1,138 @@
+import math
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from storage_data import FLOSolution, Population, Chromosome, CELL_DTYPE, dump_chromosome
+
+QUANTILES = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+# random keys drawn per batch, a batch holds at most this many layouts x cells
+BATCH_ELEMENTS = 1 << 24
+HISTOGRAM_LINES = 100
+
+
+class ScoreHistogram:
+    """
+    Counts of scores in bins of bin_width, growing to cover every added score. With bin_width 1 the quantiles are
+    exact, otherwise they are the lower edge of the bin the quantile falls in.
+    """
+
+    def __init__(self, bin_width: int = 1):
+        self.bin_width = bin_width
+        self.offset: Optional[int] = None
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total = 0
+        self.sum = 0
+        self.sum_of_squares = 0.0
+
+    def add(self, scores: np.ndarray):
+        bins = scores // self.bin_width
+        low, high = int(bins.min()), int(bins.max())
+        if self.offset is None:
+            self.offset = low
+        if low < self.offset or high - self.offset >= len(self.counts):
+            new_offset = min(low, self.offset)
+            counts = np.zeros(max(high, self.offset + len(self.counts) - 1) - new_offset + 1, dtype=np.int64)
+            counts[self.offset - new_offset:self.offset - new_offset + len(self.counts)] = self.counts
+            self.offset, self.counts = new_offset, counts
+        self.counts += np.bincount(bins - self.offset, minlength=len(self.counts))
+        self.total += len(scores)
+        self.sum += int(scores.sum())
+        self.sum_of_squares += float((scores.astype(np.float64) ** 2).sum())
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.total
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(0.0, self.sum_of_squares / self.total - self.mean ** 2))
+
+    def quantile(self, q: float) -> int:
+        position = np.searchsorted(np.cumsum(self.counts), max(1, math.ceil(q * self.total)))
+        return int(self.offset + position) * self.bin_width
+
+    def coarse(self, number_of_lines: int = HISTOGRAM_LINES) -> list[tuple[int, int]]:
+        # (lower edge, count) of at most number_of_lines equal bins spanning the scores
+        used = np.flatnonzero(self.counts)
+        counts = self.counts[used[0]:used[-1] + 1]
+        group = math.ceil(len(counts) / number_of_lines)
+        grouped = np.add.reduceat(counts, np.arange(0, len(counts), group))
+        return [((self.offset + used[0] + i * group) * self.bin_width, int(count))
+                for i, count in enumerate(grouped.tolist())]
+
+
+def random_population(board_size_x: int, board_size_y: int, number_of_layouts: int,
+                      number_of_machines: int) -> Population:
+    # uniform random layouts without overlaps, the cells of the number_of_machines smallest random keys
+    keys = genetic_operations.rng.random((number_of_layouts, board_size_x * board_size_y))
+    if number_of_machines < keys.shape[1]:
+        # argpartition picks a uniform set of cells but not a uniform order, the rows are shuffled on their own
+        cells = genetic_operations.rng.permuted(
+            np.argpartition(keys, number_of_machines - 1, axis=1)[:, :number_of_machines], axis=1)
+    else:
+        cells = np.argsort(keys, axis=1)
+    return Population(board_size_x, board_size_y, cells.astype(CELL_DTYPE))
+
+
+def sample_random_baseline(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                           number_of_samples: int = 1000000, best_k: int = 10, bin_width: int = 1,
+                           quantiles: tuple = QUANTILES, folder: Optional[str] = "results\\random") -> dict:
+    """
+    Scores of number_of_samples random layouts, generated and evaluated in batches from one loaded instance.
+    Returns (and writes to folder/random_*.txt unless folder is None) the mean, standard deviation, quantiles,
+    a histogram and the best_k layouts.
+    """
+    started = time.perf_counter()
+    solution = FLOSolution(flow_name, cost_name, x_board_size, y_board_size, 0)
+    number_of_machines = solution.max_id() + 1
+    if number_of_machines > x_board_size * y_board_size:
+        raise ValueError(f"{number_of_machines} machines do not fit a {x_board_size}x{y_board_size} board")
+    batch_size = max(1, BATCH_ELEMENTS // (x_board_size * y_board_size))
+    histogram = ScoreHistogram(bin_width)
+    best_scores = np.empty(0, dtype=np.int64)
+    best_cells = np.empty((0, number_of_machines), dtype=CELL_DTYPE)
+    for start in range(0, number_of_samples, batch_size):
+        population = random_population(x_board_size, y_board_size, min(batch_size, number_of_samples - start),
+                                       number_of_machines)
+        scores = solution.calculate_population_scores(population)
+        histogram.add(scores)
+        best_scores = np.concatenate([best_scores, scores])
+        best_cells = np.concatenate([best_cells, population.cells])
+        if len(best_scores) > best_k:
+            best = np.argpartition(best_scores, best_k - 1)[:best_k]
+            best_scores, best_cells = best_scores[best], best_cells[best]
+    order = np.argsort(best_scores, kind="stable")
+    best_scores, best_cells = best_scores[order], best_cells[order]
+
+    result = {"samples": histogram.total, "seconds": time.perf_counter() - started, "mean": histogram.mean,
+              "std": histogram.std, "quantiles": {q: histogram.quantile(q) for q in quantiles},
+              "histogram": histogram.coarse(), "best_scores": best_scores.tolist(), "best_cells": best_cells}
+    if folder is not None:
+        write_baseline(os.path.join(folder, f"random_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_"
+                                            f"{x_board_size}_{y_board_size}.txt"), result, x_board_size)
+    print(f"{histogram.total} random layouts in {result['seconds']:.2f}s, best {best_scores[0]}, "
+          f"median {result['quantiles'].get(0.5, histogram.quantile(0.5))}, mean {histogram.mean:.1f}")
+    return result
+
+
+def write_baseline(file_name: str, result: dict, board_size_x: int):
+    with open(file_name, "w", encoding="utf-8") as output:
+        output.write(f"samples;{result['samples']}\nmean;{result['mean']}\nstd;{result['std']}\n")
+        output.write("quantile;score\n")
+        for q, score in result["quantiles"].items():
+            output.write(f"{q};{score}\n")
+        output.write("histogram;count\n")
+        for edge, count in result["histogram"]:
+            output.write(f"{edge};{count}\n")
+        output.write("rank;score;layout\n")
+        for i, (score, cells) in enumerate(zip(result["best_scores"], result["best_cells"])):
+            output.write(f"{i};{score};{dump_chromosome(Chromosome.from_cells(cells, board_size_x))}\n")
+
+
+if __name__ == '__main__':
+    sample_random_baseline("dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, folder="hard\\automat")
@@ -0,0 +1,234 @@
+import json
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+from run_statistics import RunStatistics, write_summary
+from storage_data import FLOSolution, Chromosome, dump_chromosome
+
+LOG_MAGIC = b"FLORLOG\0"
+LOG_VERSION = 1
+# magic, version, board_size_x, board_size_y, number_of_machines, bytes per layout cell
+LOG_HEADER = struct.Struct("<8sHHHIB")
+# number of generation records, number of layouts
+BLOCK_HEADER = struct.Struct("<II")
+
+
+def dumps_generation(generation: int, max_generations: int) -> bool:
+    return generation % 10 == 0 or generation == max_generations
+
+
+class ResultSink:
+    """
+    Destination of the per generation best scores of a run. start() is called once with the board before the
+    first write(), best_cells is the best layout of the generation when it should be stored. Every write() also
+    updates statistics, written as the run's summary record when the sink is closed.
+    """
+    EXTENSION = ""
+
+    def __init__(self, file_name: Optional[str] = None, statistics: Optional[RunStatistics] = None):
+        self.file_name = file_name
+        self.statistics = statistics if statistics is not None else RunStatistics()
+        self.board_size_x = 0
+        self.board_size_y = 0
+        self.number_of_machines = 0
+        self.started = False
+
+    def start(self, board_size_x: int, board_size_y: int, number_of_machines: int):
+        self.board_size_x = board_size_x
+        self.board_size_y = board_size_y
+        self.number_of_machines = number_of_machines
+        self.started = True
+
+    def write(self, generation: int, best_score: int, best_cells: Optional[np.ndarray] = None):
+        self.statistics.update(generation, best_score)
+        self.write_record(generation, best_score, best_cells)
+
+    def write_record(self, generation: int, best_score: int, best_cells: Optional[np.ndarray] = None):
+        raise NotImplementedError()
+
+    def write_generation(self, solution: FLOSolution, max_generations: int):
+        if not self.started:
+            self.start(solution.board_size_x, solution.board_size_y, solution.population.number_of_machines)
+        best_cells = None
+        if dumps_generation(solution.generation, max_generations):
+            print(solution)
+            best_cells = solution.population.cells[0]
+        self.write(solution.generation, solution.best_score, best_cells)
+
+    def close(self):
+        if self.file_name is not None and self.statistics.count > 0:
+            write_summary(self.file_name, self.statistics)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class TextResultSink(ResultSink):
+    """
+    The output_*.txt format, one "generation;best_score" line per generation and the best layout as json every
+    10 generations.
+    """
+    EXTENSION = ".txt"
+
+    def __init__(self, file_name: str, mode: str = "w", statistics: Optional[RunStatistics] = None):
+        super().__init__(file_name, statistics)
+        self.file = open(file_name, mode, encoding="utf-8")
+
+    def write_record(self, generation: int, best_score: int, best_cells: Optional[np.ndarray] = None):
+        if best_cells is not None:
+            chromosome = Chromosome.from_cells(np.asarray(best_cells), self.board_size_x)
+            self.file.write(f"{generation};{best_score};{dump_chromosome(chromosome)}\n")
+            self.file.flush()
+        else:
+            self.file.write(f"{generation};{best_score}\n")
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            super().close()
+
+
+class BinaryResultSink(ResultSink):
+    """
+    Append-only binary run log. After the file header the log is a sequence of blocks, each one holding up to
+    batch_size generation records as columns (int32 generations, int64 scores) followed by the generations and
+    packed cells of the best layouts stored in that batch. Blocks are only written when the batch is full or the
+    sink is closed.
+    """
+    EXTENSION = ".bin"
+
+    def __init__(self, file_name: str, mode: str = "w", batch_size: int = 1000,
+                 statistics: Optional[RunStatistics] = None):
+        super().__init__(file_name, statistics)
+        self.batch_size = batch_size
+        self.file = open(file_name, mode + "b")
+        self.cell_dtype = np.int16
+        if mode == "a" and self.file.tell() > 0:
+            board_size_x, board_size_y, number_of_machines, cell_bytes = read_log_header(file_name)
+            super().start(board_size_x, board_size_y, number_of_machines)
+            self.cell_dtype = np.int16 if cell_bytes == 2 else np.int32
+        self.generations: list[int] = []
+        self.scores: list[int] = []
+        self.layout_generations: list[int] = []
+        self.layouts: list[np.ndarray] = []
+
+    def start(self, board_size_x: int, board_size_y: int, number_of_machines: int):
+        super().start(board_size_x, board_size_y, number_of_machines)
+        cell_bytes = 2 if board_size_x * board_size_y <= np.iinfo(np.int16).max else 4
+        self.cell_dtype = np.int16 if cell_bytes == 2 else np.int32
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, board_size_x, board_size_y, number_of_machines,
+                                        cell_bytes))
+
+    def write_record(self, generation: int, best_score: int, best_cells: Optional[np.ndarray] = None):
+        self.generations.append(generation)
+        self.scores.append(best_score)
+        if best_cells is not None:
+            self.layout_generations.append(generation)
+            self.layouts.append(np.array(best_cells, dtype=self.cell_dtype))
+        if len(self.generations) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.generations:
+            return
+        self.file.write(BLOCK_HEADER.pack(len(self.generations), len(self.layouts)))
+        self.file.write(np.array(self.generations, dtype=np.int32).tobytes())
+        self.file.write(np.array(self.scores, dtype=np.int64).tobytes())
+        self.file.write(np.array(self.layout_generations, dtype=np.int32).tobytes())
+        if self.layouts:
+            self.file.write(np.stack(self.layouts).tobytes())
+        self.file.flush()
+        self.generations.clear()
+        self.scores.clear()
+        self.layout_generations.clear()
+        self.layouts.clear()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+            super().close()
+
+
+def read_log_header(file_name: str) -> tuple[int, int, int, int]:
+    with open(file_name, "rb") as file:
+        magic, version, *header = LOG_HEADER.unpack(file.read(LOG_HEADER.size))
+    if magic != LOG_MAGIC:
+        raise ValueError(f"{file_name} is not a binary run log")
+    if version > LOG_VERSION:
+        raise ValueError(f"Run log version {version} of {file_name} is newer than {LOG_VERSION}")
+    return tuple(header)
+
+
+def read_binary_log(file_name: str) -> tuple[tuple[int, int, int, int], np.ndarray, np.ndarray, dict[int, np.ndarray]]:
+    """
+    Returns the header (board_size_x, board_size_y, number_of_machines, cell bytes), the generations and scores of
+    every record and the dumped best layouts keyed by generation.
+    """
+    header = read_log_header(file_name)
+    _, _, number_of_machines, cell_bytes = header
+    cell_dtype = np.int16 if cell_bytes == 2 else np.int32
+    data = np.fromfile(file_name, dtype=np.uint8, offset=LOG_HEADER.size)
+    generations, scores, layouts = [], [], {}
+    position = 0
+    while position < len(data):
+        number_of_records, number_of_layouts = BLOCK_HEADER.unpack_from(data, position)
+        position += BLOCK_HEADER.size
+        generations.append(np.frombuffer(data, np.int32, number_of_records, position))
+        position += 4 * number_of_records
+        scores.append(np.frombuffer(data, np.int64, number_of_records, position))
+        position += 8 * number_of_records
+        layout_generations = np.frombuffer(data, np.int32, number_of_layouts, position)
+        position += 4 * number_of_layouts
+        cells = np.frombuffer(data, cell_dtype, number_of_layouts * number_of_machines, position)
+        position += cell_bytes * number_of_layouts * number_of_machines
+        for generation, row in zip(layout_generations.tolist(), cells.reshape(number_of_layouts, number_of_machines)):
+            layouts[generation] = row.astype(np.int32)
+    if not generations:
+        return header, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64), layouts
+    return header, np.concatenate(generations), np.concatenate(scores), layouts
+
+
+def binary_to_text(file_name: str, text_file_name: Optional[str] = None) -> str:
+    text_file_name = text_file_name if text_file_name is not None else os.path.splitext(file_name)[0] + ".txt"
+    (board_size_x, _, _, _), generations, scores, layouts = read_binary_log(file_name)
+    with open(text_file_name, "w", encoding="utf-8") as output:
+        for generation, score in zip(generations.tolist(), scores.tolist()):
+            if generation in layouts:
+                chromosome = Chromosome.from_cells(layouts[generation], board_size_x)
+                output.write(f"{generation};{score};{dump_chromosome(chromosome)}\n")
+            else:
+                output.write(f"{generation};{score}\n")
+    return text_file_name
+
+
+def text_to_binary(file_name: str, binary_file_name: Optional[str] = None, board_size_x: Optional[int] = None,
+                   board_size_y: Optional[int] = None) -> str:
+    # the board size is read from the output_* file name unless given
+    binary_file_name = binary_file_name if binary_file_name is not None else os.path.splitext(file_name)[0] + ".bin"
+    if board_size_x is None or board_size_y is None:
+        splitted = os.path.basename(file_name)[:-4].split("_")
+        board_size_x, board_size_y = int(splitted[4]), int(splitted[5])
+    records = []
+    with open(file_name, "r", encoding="utf-8") as input_file:
+        for e in input_file:
+            if e.strip() == "":
+                continue
+            split = e.split(";", 2)
+            best_cells = None
+            if len(split) == 3:
+                machines = sorted(json.loads(split[2])["machines"], key=lambda d: d["machineId"])
+                best_cells = np.array([m["posY"] * board_size_x + m["posX"] for m in machines])
+            records.append((int(split[0]), int(split[1]), best_cells))
+    number_of_machines = next((len(e[2]) for e in records if e[2] is not None), 0)
+    with BinaryResultSink(binary_file_name) as sink:
+        sink.start(board_size_x, board_size_y, number_of_machines)
+        for generation, score, best_cells in records:
+            sink.write(generation, score, best_cells)
+    return binary_file_name
@@ -0,0 +1,145 @@
+import json
+import math
+import os
+from typing import Optional
+
+
+class MedianEstimator:
+    """
+    P-square estimate of the median (Jain, Chlamtac 1985), five markers instead of all the values.
+    Exact until the sixth value.
+    """
+
+    def __init__(self, quantile: float = 0.5):
+        self.quantile = quantile
+        self.heights: list[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def update(self, value: float):
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = next(i for i in range(4) if heights[i] <= value < heights[i + 1])
+        for i in range(k + 1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - self.positions[i]
+            if (d >= 1 and self.positions[i + 1] - self.positions[i] > 1) or \
+                    (d <= -1 and self.positions[i - 1] - self.positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self.parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (self.positions[i + d] - self.positions[i])
+                heights[i] = height
+                self.positions[i] += d
+
+    def parabolic(self, i: int, d: int) -> float:
+        n, q = self.positions, self.heights
+        return q[i] + d / (n[i + 1] - n[i - 1]) * ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                                                   (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            middle = (len(self.heights) - 1) * self.quantile
+            low, high = self.heights[math.floor(middle)], self.heights[math.ceil(middle)]
+            return low + (high - low) * (middle - math.floor(middle))
+        return self.heights[2]
+
+
+class RunStatistics:
+    """
+    Statistics of the best score of every generation of one run, updated as the run goes: Welford mean and
+    variance, minimum, the generation it was first reached at, an estimate of the median and how often the best
+    score improved.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min_score: Optional[int] = None
+        self.last_score: Optional[int] = None
+        self.first_generation: Optional[int] = None
+        self.last_generation: Optional[int] = None
+        self.best_generation: Optional[int] = None
+        self.improvements = 0
+        self.median = MedianEstimator()
+        # lower bound of the score of the instance, see bounds.lower_bound
+        self.lower_bound: Optional[int] = None
+
+    def update(self, generation: int, score: int):
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        if self.min_score is None or score < self.min_score:
+            if self.min_score is not None:
+                self.improvements += 1
+            self.min_score = score
+            self.best_generation = generation
+        if self.first_generation is None:
+            self.first_generation = generation
+        self.last_generation = generation
+        self.last_score = score
+        self.median.update(score)
+
+    @property
+    def variance(self) -> Optional[float]:
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    def summary(self) -> dict:
+        return {"generations": self.count, "first_generation": self.first_generation,
+                "last_generation": self.last_generation, "last_score": self.last_score,
+                "min_score": self.min_score, "best_generation": self.best_generation,
+                "generations_to_best": self.best_generation - self.first_generation if self.count else None,
+                "improvements": self.improvements,
+                "improvement_rate": self.improvements / (self.count - 1) if self.count > 1 else 0.0,
+                "mean": self.mean if self.count else None, "variance": self.variance, "median": self.median.value(),
+                "lower_bound": self.lower_bound,
+                "optimality_gap": optimality_gap(self.min_score, self.lower_bound)
+                if self.min_score is not None and self.lower_bound is not None else None}
+
+
+def optimality_gap(score: int, lower_bound: int) -> float:
+    # how far above the bound score is, relative to the bound
+    if score <= lower_bound:
+        return 0.0
+    return (score - lower_bound) / lower_bound if lower_bound > 0 else math.inf
+
+
+def summary_path(file_name: str) -> str:
+    # next to the run log, in a folder of its own so the results folder still only holds output_* logs
+    return os.path.join(os.path.dirname(file_name), "summaries", os.path.basename(file_name) + ".json")
+
+
+def write_summary(file_name: str, statistics: RunStatistics):
+    os.makedirs(os.path.dirname(summary_path(file_name)), exist_ok=True)
+    with open(summary_path(file_name), "w", encoding="utf-8") as output:
+        json.dump(statistics.summary(), output)
+
+
+def read_summary(file_name: str) -> Optional[dict]:
+    """
+    The summary record of the run log file_name, None when there is none or the log changed after it was written.
+    """
+    path = summary_path(file_name)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(file_name):
+        return None
+    with open(path, "r", encoding="utf-8") as input_file:
+        return json.load(input_file)
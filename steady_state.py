@@ -0,0 +1,167 @@
+import os
+import random
+from typing import Optional
+
+import numpy as np
+
+import genetic_operations
+from genetic_operations import generate_random_solution, select_tournament, cross_population, mutate_population
+from run_log import TextResultSink
+from storage_data import FLOSolution
+from traning_center import RESULTS_FOLDER, evolve_generation, output_file_name
+
+REPLACEMENTS = ("worst", "tournament")
+
+
+def replacement_rows(scores: np.ndarray, number_of_rows: int, number_of_elites: int = 1, replacement: str = "worst",
+                     sample_size: int = 3) -> np.ndarray:
+    """
+    Rows of the population the offspring replace, never one of the number_of_elites best. "worst" takes the worst
+    rows, "tournament" the worst of sample_size random rows for every offspring (a reverse tournament).
+    """
+    order = np.argsort(scores, kind="stable")
+    candidates = order[number_of_elites:]
+    number_of_rows = min(number_of_rows, len(candidates))
+    if replacement == "worst":
+        return candidates[len(candidates) - number_of_rows:]
+    if replacement == "tournament":
+        victims = []
+        remaining = candidates
+        for i in range(number_of_rows):
+            sample = genetic_operations.rng.choice(len(remaining), min(sample_size, len(remaining)), replace=False)
+            # candidates are sorted best first, the highest position is the worst of the sample
+            worst = sample.max()
+            victims.append(remaining[worst])
+            remaining = np.delete(remaining, worst)
+        return np.array(victims, dtype=np.int64)
+    raise ValueError(f"Unknown replacement {replacement}, expected one of {REPLACEMENTS}")
+
+
+def steady_state_step(solution: FLOSolution, number_of_offspring: int, sample_size: float, cross_chance: float,
+                      mutation_chance: float, number_of_mutations: int, replacement: str = "worst",
+                      number_of_elites: int = 1, replacement_sample_size: int = 3) -> FLOSolution:
+    """
+    Breeds number_of_offspring children of tournament selected pairs and puts them in place of replaced rows of the
+    population. Only the inserted children are evaluated, once they are mutated, the rest of the population keeps
+    its scores. The population stays sorted by score, so the elites are its first rows.
+    """
+    scores = solution.calculate_scores()
+    pairs = select_tournament(scores, (number_of_offspring, 2), sample_size)
+    offspring = solution.next_generation()
+    if random.random() > cross_chance:
+        offspring.population = solution.population.take(pairs[:, 0])
+    else:
+        offspring.population = cross_population(solution.population, number_of_offspring, parent_indices=pairs)
+    mutate_population(offspring.population, mutation_chance, number_of_mutations)
+
+    victims = replacement_rows(scores, number_of_offspring, number_of_elites, replacement, replacement_sample_size)
+    inserted = offspring.population.take(np.arange(len(victims)))
+    solution.population.cells[victims] = inserted.cells
+    scores[victims] = solution.calculate_cached_scores(inserted)
+    solution.generation += 1
+    solution.sort_chromosomes_by_score()
+    return solution
+
+
+def start_training_steady_state(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                                number_of_chromosomes: int, mutation_chance: float, number_of_mutations: int,
+                                sample_size: float, cross_chance: float, number_of_offspring: int = 2,
+                                replacement: str = "worst", number_of_elites: int = 1, max_steps: int = 0,
+                                max_evaluations: int = 0, log_every: Optional[int] = None,
+                                results_folder: str = RESULTS_FOLDER, id=0, result_sink=TextResultSink) -> list:
+    """
+    Steady-state training: every step replaces number_of_offspring layouts of the population instead of breeding a
+    whole new generation, see steady_state_step. Runs until max_steps steps or max_evaluations fitness evaluations
+    (0 is no limit, at least one has to be given). The best score is written every log_every steps, by default
+    every number_of_chromosomes / number_of_offspring steps, about one generation of the generational loops.
+    Returns the (evaluations, best_score) pairs of every logged step, also written to evaluations_*.txt.
+    """
+    if max_steps <= 0 and max_evaluations <= 0:
+        raise ValueError("Steady-state training needs max_steps or max_evaluations")
+    log_every = log_every if log_every is not None else max(1, number_of_chromosomes // number_of_offspring)
+    solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes)
+    solution.sort_chromosomes_by_score()
+    file_name = output_file_name("t", x_board_size, y_board_size, number_of_chromosomes, mutation_chance,
+                                 number_of_mutations, cross_chance, max_steps, sample_size,
+                                 f"_steady_{number_of_offspring}_{replacement}", result_sink.EXTENSION)
+    curve = []
+    with result_sink(os.path.join(results_folder, file_name)) as output:
+        while True:
+            evaluations = solution.fitness_cache.misses
+            finished = (0 < max_steps <= solution.generation) or (0 < max_evaluations <= evaluations)
+            if solution.generation % log_every == 0 or finished:
+                output.write_generation(solution, max_steps)
+                curve.append((evaluations, solution.best_score))
+            if finished:
+                break
+            steady_state_step(solution, number_of_offspring, sample_size, cross_chance, mutation_chance,
+                              number_of_mutations, replacement, number_of_elites)
+    write_curve(os.path.join(results_folder, "evaluations_" + os.path.splitext(file_name)[0] + ".txt"), curve)
+    print(f"Finished training at step {solution.generation} after {solution.fitness_cache.misses} evaluations "
+          f"with score {solution.best_score}")
+    with open(os.path.join(results_folder, "finished", f"{id}.finished"), "w") as out:
+        out.close()
+    return curve
+
+
+def write_curve(file_name: str, curve: list):
+    with open(file_name, "w", encoding="utf-8") as output:
+        output.write("evaluations;best_score\n")
+        for evaluations, best_score in curve:
+            output.write(f"{evaluations};{best_score}\n")
+
+
+def generational_curve(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                       number_of_chromosomes: int, mutation_chance: float, number_of_mutations: int,
+                       sample_size: float, cross_chance: float, max_evaluations: int, max_generations: int = 0,
+                       parent_pairs: bool = True) -> list:
+    # (evaluations, best_score) of the tournament loop of traning_center, without writing its results
+    solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes)
+    last_solutions = []
+    curve = []
+    while True:
+        solution.sort_chromosomes_by_score()
+        best_score = min(solution.best_score, curve[-1][1]) if curve else solution.best_score
+        curve.append((solution.fitness_cache.misses, best_score))
+        if solution.fitness_cache.misses >= max_evaluations or 0 < max_generations <= len(curve) - 1:
+            return curve
+        last_solutions.append(solution.best_score)
+        if len(last_solutions) > 10:
+            last_solutions.pop(0)
+        solution = evolve_generation(solution, last_solutions, "t", mutation_chance, number_of_mutations,
+                                     cross_chance, sample_size, parent_pairs)
+
+
+def compare_with_generational(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                              number_of_chromosomes: int, mutation_chance: float, number_of_mutations: int,
+                              sample_size: float, cross_chance: float, max_evaluations: int,
+                              number_of_offspring: int = 2, replacement: str = "worst", number_of_elites: int = 1,
+                              max_generations: int = 500, seed: int = 0,
+                              results_folder: str = RESULTS_FOLDER) -> dict[str, list]:
+    """
+    Best score against fitness evaluations of the steady-state and the generational tournament loop, both run
+    with the same seed and evaluation budget. Only layouts missing from the fitness cache count as evaluations, a
+    converged population breeds mostly known layouts, so both runs also stop after breeding max_generations *
+    number_of_chromosomes layouts. The best score of the generational loop is the best seen so far, it can lose its
+    best layout. Both curves go to results_folder/evaluations_*.txt.
+    """
+    genetic_operations.seed(seed)
+    steady = start_training_steady_state(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes,
+                                         mutation_chance, number_of_mutations, sample_size, cross_chance,
+                                         number_of_offspring, replacement, number_of_elites,
+                                         max_generations * number_of_chromosomes // number_of_offspring,
+                                         max_evaluations, results_folder=results_folder)
+    genetic_operations.seed(seed)
+    generational = generational_curve(flow_name, cost_name, x_board_size, y_board_size, number_of_chromosomes,
+                                      mutation_chance, number_of_mutations, sample_size, cross_chance,
+                                      max_evaluations, max_generations)
+    write_curve(os.path.join(results_folder, f"evaluations_generational_{x_board_size}_{y_board_size}_"
+                                             f"{number_of_chromosomes}_{max_evaluations}.txt"), generational)
+    for name, curve in (("steady-state", steady), ("generational", generational)):
+        print(f"{name}: best {curve[-1][1]} after {curve[-1][0]} evaluations")
+    return {"steady": steady, "generational": generational}
+
+
+if __name__ == '__main__':
+    compare_with_generational("dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, 200, 0.3, 8, 0.1, 0.9, 20000,
+                              results_folder="hard\\tournament")
@@ -1,8 +1,19 @@
+import hashlib
 import json
-from typing import Optional
+import os
+from collections import OrderedDict, Counter
+from typing import Optional, Union
+
+import numpy as np
+
+import profiling
+
+CELL_DTYPE = np.int32
 
 
 class FLOMachine:
+    __slots__ = ("machineId", "posX", "posY")
+
     def __init__(self, machineId: int, posX: int, posY: int):
         self.machineId = machineId
         self.posX = posX
@@ -19,7 +30,10 @@ class FLOMachine:
             return False
         return other.machineId == self.machineId and self.posX == other.posX and self.posY == self.posY
 
+
 class FLOMachineConnection:
+    __slots__ = ("source", "target", "amount", "cost")
+
     def __init__(self, source: int, target: int, amount: int, cost: int):
         self.source = source
         self.target = target
@@ -34,6 +48,9 @@ class FLOMachineConnection:
 
 
 class Chromosome:
+    __slots__ = ("machines",)
+
+    # machines are kept sorted by id, with ids 0..max_id the id is also the index in machines
     def __init__(self, floMachines: list[FLOMachine] = None):
         if floMachines is None:
             floMachines = []
@@ -46,17 +63,12 @@ class Chromosome:
         self.machines.sort(key=lambda d: d.machineId)
 
     def get_number_of_overlaps(self):
-        overlaps = 0
-        for i in range(len(self.machines)):
-            machine1 = self.machines[i]
-            for j in range(i + 1, len(self.machines)):
-                machine2 = self.machines[j]
-                if machine1.posX == machine2.posX and machine1.posY == machine2.posY:
-                    overlaps += 1
-
-        return overlaps
+        occupied = Counter((e.posX, e.posY) for e in self.machines)
+        return sum(count * (count - 1) // 2 for count in occupied.values())
 
     def __getitem__(self, key):
+        if 0 <= key < len(self.machines) and self.machines[key].machineId == key:
+            return self.machines[key]
         for e in self.machines:
             if e.machineId == key:
                 return e
@@ -75,44 +87,479 @@ class Chromosome:
                 return False
         return True
 
+    @staticmethod
+    def from_cells(cells: np.ndarray, board_size_x: int):
+        return Chromosome([FLOMachine(machine_id, cell % board_size_x, cell // board_size_x) for machine_id, cell in
+                           enumerate(cells.tolist())])
+
+    def to_cells(self, board_size_x: int) -> np.ndarray:
+        return np.array([e.posY * board_size_x + e.posX for e in self.machines], dtype=CELL_DTYPE)
+
+
+class OccupancyGrid:
+    """
+    Cell -> machine lookup of one layout. counts holds the number of machines standing on every cell and owner the
+    lowest machine id among them (-1 for a free cell). move and swap keep the grid and the layout row in sync.
+    """
+
+    def __init__(self, cells: np.ndarray, number_of_cells: int):
+        self.cells = cells
+        placed = np.flatnonzero(cells >= 0)
+        self.counts = np.bincount(cells[placed], minlength=number_of_cells)
+        self.owner = np.full(number_of_cells, len(cells), dtype=np.int64)
+        np.minimum.at(self.owner, cells[placed], placed)
+        self.owner[self.owner == len(cells)] = -1
+
+    def machine_at(self, cell: int) -> int:
+        return int(self.owner[cell])
+
+    def is_free(self, cell: int) -> bool:
+        return self.counts[cell] == 0
+
+    def free_cells(self) -> np.ndarray:
+        return np.flatnonzero(self.counts == 0)
+
+    def number_of_overlaps(self) -> int:
+        return int((self.counts * (self.counts - 1) // 2).sum())
+
+    def move(self, machine: int, new_cell: int):
+        old_cell = int(self.cells[machine])
+        if old_cell == new_cell:
+            return
+        self.cells[machine] = new_cell
+        if old_cell >= 0:
+            self.counts[old_cell] -= 1
+            if self.owner[old_cell] == machine:
+                # only layouts with overlaps get here with machines left behind
+                left = np.flatnonzero(self.cells == old_cell) if self.counts[old_cell] > 0 else []
+                self.owner[old_cell] = left[0] if len(left) > 0 else -1
+        self.counts[new_cell] += 1
+        if self.owner[new_cell] == -1 or machine < self.owner[new_cell]:
+            self.owner[new_cell] = machine
+
+    def swap(self, machine1: int, machine2: int):
+        cell1, cell2 = int(self.cells[machine1]), int(self.cells[machine2])
+        if cell1 == cell2:
+            return
+        self.cells[machine1], self.cells[machine2] = cell2, cell1
+        for cell, old_machine, new_machine in ((cell1, machine1, machine2), (cell2, machine2, machine1)):
+            if self.owner[cell] == old_machine:
+                self.owner[cell] = np.flatnonzero(self.cells == cell)[0]
+            elif new_machine < self.owner[cell]:
+                self.owner[cell] = new_machine
+
+
+class Population:
+    """
+    All layouts of a generation in one array, one row per individual and one column per machine id.
+    A machine standing at posX x posY is stored as the cell index posY * board_size_x + posX.
+    """
+
+    def __init__(self, board_size_x: int, board_size_y: int, cells: np.ndarray):
+        self.board_size_x = board_size_x
+        self.board_size_y = board_size_y
+        self.cells = np.ascontiguousarray(cells, dtype=CELL_DTYPE)
+
+    @staticmethod
+    def empty(board_size_x: int, board_size_y: int, number_of_chromosomes: int = 0, number_of_machines: int = 0):
+        return Population(board_size_x, board_size_y,
+                          np.full((number_of_chromosomes, number_of_machines), -1, dtype=CELL_DTYPE))
+
+    @staticmethod
+    def from_chromosomes(chromosomes: list[Chromosome], board_size_x: int, board_size_y: int):
+        if len(chromosomes) == 0:
+            return Population.empty(board_size_x, board_size_y)
+        return Population(board_size_x, board_size_y, np.stack([c.to_cells(board_size_x) for c in chromosomes]))
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    @property
+    def number_of_machines(self):
+        return self.cells.shape[1]
+
+    @property
+    def number_of_cells(self):
+        return self.board_size_x * self.board_size_y
+
+    @property
+    def pos_x(self) -> np.ndarray:
+        return self.cells % self.board_size_x
+
+    @property
+    def pos_y(self) -> np.ndarray:
+        return self.cells // self.board_size_x
+
+    def cell(self, pos_x: int, pos_y: int) -> int:
+        return pos_y * self.board_size_x + pos_x
+
+    def chromosome(self, index: int) -> Chromosome:
+        return Chromosome.from_cells(self.cells[index], self.board_size_x)
+
+    def occupancy(self, index: int) -> OccupancyGrid:
+        return OccupancyGrid(self.cells[index], self.number_of_cells)
+
+    def occupancy_counts(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        cells = self.cells[start:stop].astype(np.int64)
+        offsets = np.arange(len(cells), dtype=np.int64)[:, None] * self.number_of_cells
+        counts = np.bincount((cells + offsets).ravel(), minlength=len(cells) * self.number_of_cells)
+        return counts.reshape(len(cells), self.number_of_cells)
+
+    def chromosomes(self) -> list[Chromosome]:
+        return [self.chromosome(i) for i in range(len(self))]
+
+    def set_chromosome(self, index: int, chromosome: Chromosome):
+        self.cells[index] = chromosome.to_cells(self.board_size_x)
+
+    def take(self, indices) -> "Population":
+        return Population(self.board_size_x, self.board_size_y, self.cells[np.asarray(indices, dtype=np.intp)])
+
+    def copy(self) -> "Population":
+        return Population(self.board_size_x, self.board_size_y, self.cells.copy())
+
+
+class FitnessCache:
+    """
+    Scores of already evaluated layouts keyed by a 16 byte digest of their population row, so an entry costs the
+    same on every board size. Least recently used layouts are evicted once max_size is reached.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.entries: OrderedDict[bytes, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(cells: np.ndarray) -> bytes:
+        return hashlib.blake2b(np.ascontiguousarray(cells), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[int]:
+        score = self.entries.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return score
+
+    def put(self, key: bytes, score: int):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = score
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __str__(self):
+        return f"FitnessCache {len(self.entries)}/{self.max_size} hits: {self.hits} misses: {self.misses}"
+
+
+class SparseWeights:
+    """
+    amount * cost of every connection in sparse form. Distances are symmetric so both directions of a pair are
+    merged into one edge (sources < targets), self connections cost nothing and are left out. indptr, indices and
+    data are the same weights as a symmetric CSR matrix, row i holding the neighbours of machine i.
+    number_of_machines also counts machines without any flow.
+    """
+
+    def __init__(self, number_of_machines: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray):
+        self.number_of_machines = number_of_machines
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+        rows = np.concatenate([sources, targets])
+        order = np.argsort(rows, kind="stable")
+        self.indices = np.concatenate([targets, sources])[order]
+        self.data = np.concatenate([weights, weights])[order]
+        self.indptr = np.zeros(number_of_machines + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=number_of_machines), out=self.indptr[1:])
+
+    @staticmethod
+    def from_connections(connections: list[FLOMachineConnection], number_of_machines: Optional[int] = None):
+        return SparseWeights.from_arrays(np.array([x.source for x in connections], dtype=np.int64),
+                                         np.array([x.target for x in connections], dtype=np.int64),
+                                         np.array([x.amount * x.cost for x in connections], dtype=np.int64),
+                                         number_of_machines)
+
+    @staticmethod
+    def from_arrays(sources: np.ndarray, targets: np.ndarray, weights: np.ndarray,
+                    number_of_machines: Optional[int] = None):
+        if number_of_machines is None:
+            number_of_machines = int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+        low, high = np.minimum(sources, targets), np.maximum(sources, targets)
+        keep = low != high
+        pairs, inverse = np.unique(low[keep] * number_of_machines + high[keep], return_inverse=True)
+        merged = np.bincount(inverse, weights[keep], minlength=len(pairs)).astype(np.int64)
+        nonzero = merged != 0
+        pairs = pairs[nonzero]
+        return SparseWeights(number_of_machines, pairs // number_of_machines, pairs % number_of_machines,
+                             merged[nonzero])
+
+    def __len__(self):
+        return len(self.weights)
+
+    def neighbours(self, machine: int) -> tuple[np.ndarray, np.ndarray]:
+        start, stop = self.indptr[machine], self.indptr[machine + 1]
+        return self.indices[start:stop], self.data[start:stop]
+
+    def edges(self, number_of_machines: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # edges between the first number_of_machines machines, layouts may hold fewer machines than the instance
+        if number_of_machines >= self.number_of_machines:
+            return self.sources, self.targets, self.weights
+        inside = self.targets < number_of_machines
+        return self.sources[inside], self.targets[inside], self.weights[inside]
+
+    def to_dense(self) -> np.ndarray:
+        dense = np.zeros((self.number_of_machines, self.number_of_machines), dtype=np.int64)
+        dense[self.sources, self.targets] = self.weights
+        return dense + dense.T
+
+
+class CompiledInstance:
+    """
+    A flow/cost instance joined into arrays, one entry per connection with a non zero amount, plus the weights
+    and adjacency built from them. number_of_machines counts every machine of the flow file, also those without
+    flow. The FLOMachineConnection objects are only built when asked for.
+    """
+
+    def __init__(self, number_of_machines: int, sources: np.ndarray, targets: np.ndarray, amounts: np.ndarray,
+                 costs: np.ndarray, content_hash: str = ""):
+        self.number_of_machines = number_of_machines
+        self.sources = sources
+        self.targets = targets
+        self.amounts = amounts
+        self.costs = costs
+        self.content_hash = content_hash
+        self.weights = SparseWeights.from_arrays(sources, targets, amounts * costs, number_of_machines)
+        self.adjacency = build_adjacency(self.weights)
+        self._connections: Optional[list[FLOMachineConnection]] = None
+
+    @property
+    def connections(self) -> list[FLOMachineConnection]:
+        if self._connections is None:
+            self._connections = [FLOMachineConnection(*e) for e in zip(self.sources.tolist(), self.targets.tolist(),
+                                                                        self.amounts.tolist(), self.costs.tolist())]
+        return self._connections
+
+    @staticmethod
+    def empty():
+        empty = np.empty(0, dtype=np.int64)
+        return CompiledInstance(0, empty, empty, empty, empty)
+
+    def save(self, file_name: str):
+        # jobs compiling the same instance at once each write their own file, the last rename wins
+        temporary_name = f"{file_name}.{os.getpid()}.tmp"
+        with open(temporary_name, "wb") as file:
+            np.savez(file, version=INSTANCE_CACHE_VERSION, number_of_machines=self.number_of_machines,
+                     sources=self.sources, targets=self.targets, amounts=self.amounts, costs=self.costs)
+        os.replace(temporary_name, file_name)
+
+    @staticmethod
+    def load(file_name: str, content_hash: str = ""):
+        with np.load(file_name) as data:
+            if int(data["version"]) != INSTANCE_CACHE_VERSION:
+                raise ValueError(f"{file_name} is a compiled instance of version {int(data['version'])}")
+            return CompiledInstance(int(data["number_of_machines"]), data["sources"], data["targets"],
+                                    data["amounts"], data["costs"], content_hash)
+
+
+INSTANCE_CACHE_FOLDER = ".instance_cache"
+INSTANCE_CACHE_VERSION = 1
+# instances registered by preload_instance, FLOSolution reuses them instead of reading the json files again
+LOADED_INSTANCES: dict[tuple[str, str], CompiledInstance] = {}
+
 
 class FLOSolution:
     def __init__(self, paths_flow_file_name: Optional[str], paths_cost_file_name: Optional[str], board_size_x: int,
                  board_size_y: int,
-                 number_of_chromosomes: int = 10, generation: int = 0, best_score: int = 0):
+                 number_of_chromosomes: int = 10, generation: int = 0, best_score: int = 0,
+                 fitness_cache: Optional[FitnessCache] = None):
         self.generation = generation
         self.best_score = best_score
         self.number_of_chromosomes = number_of_chromosomes
-        self.chromosomes: list[Chromosome] = []
-        if paths_cost_file_name is not None and paths_cost_file_name is not None:
-            self.connections = load_machine_connections(paths_flow_file_name, paths_cost_file_name)
+        if (paths_flow_file_name, paths_cost_file_name) in LOADED_INSTANCES:
+            self.instance = LOADED_INSTANCES[(paths_flow_file_name, paths_cost_file_name)]
+        elif paths_flow_file_name is not None and paths_cost_file_name is not None:
+            self.instance = load_instance(paths_flow_file_name, paths_cost_file_name)
         else:
-            self.connections = []
+            self.instance = CompiledInstance.empty()
+        self.weights = self.instance.weights
+        self.adjacency = self.instance.adjacency
         self.board_size_x = board_size_x
         self.board_size_y = board_size_y
+        self.population = Population.empty(board_size_x, board_size_y)
+        # scores[i] is the cost of population row i, None when the rows changed since the last evaluation
+        self.scores: Optional[np.ndarray] = None
+        self.fitness_cache = fitness_cache if fitness_cache is not None else FitnessCache()
+        # optional object with evaluate(solution, population) used instead of calculate_population_scores,
+        # see parallel_evaluation.ParallelEvaluator
+        self.evaluator = None
+
+    @property
+    def connections(self) -> list[FLOMachineConnection]:
+        return self.instance.connections
+
+    @property
+    def chromosomes(self) -> tuple[Chromosome, ...]:
+        # copies decoded from the population, a tuple so appending fails instead of being lost. Editing the
+        # Chromosome objects changes nothing either, only assigning chromosomes (or set_chromosome) does
+        return tuple(self.population.chromosomes())
+
+    @chromosomes.setter
+    def chromosomes(self, chromosomes: list[Chromosome]):
+        self.population = Population.from_chromosomes(chromosomes, self.board_size_x, self.board_size_y)
+        self.scores = None
 
     def max_id(self):
-        return max([max(x.source, x.target) for x in self.connections])
+        return self.instance.number_of_machines - 1
+
+    def calculate_scores(self) -> np.ndarray:
+        if self.scores is None or len(self.scores) != len(self.population):
+            self.scores = self.calculate_cached_scores(self.population)
+        return self.scores
+
+    def calculate_cached_scores(self, population: Population) -> np.ndarray:
+        scores = np.empty(len(population), dtype=np.int64)
+        # duplicated offspring share one entry so every distinct layout is evaluated once
+        missing: dict[bytes, list[int]] = {}
+        for i, cells in enumerate(population.cells):
+            key = FitnessCache.fingerprint(cells)
+            if key in missing:
+                self.fitness_cache.hits += 1
+                missing[key].append(i)
+                continue
+            score = self.fitness_cache.get(key)
+            if score is None:
+                missing[key] = [i]
+            else:
+                scores[i] = score
+        if missing:
+            first_rows = [rows[0] for rows in missing.values()]
+            with profiling.profiler.phase("fitness"):
+                if self.evaluator is not None:
+                    new_scores = self.evaluator.evaluate(self, population.take(first_rows))
+                else:
+                    new_scores = self.calculate_population_scores(population.take(first_rows))
+            for (key, rows), score in zip(missing.items(), new_scores.tolist()):
+                scores[rows] = score
+                self.fitness_cache.put(key, score)
+        return scores
+
+    def calculate_population_scores(self, population: Population, overlap_penelty: int = 10000,
+                                    chunk_elements: int = 1 << 22) -> np.ndarray:
+        sources, targets, weights = self.weights.edges(population.number_of_machines)
+        scores = np.empty(len(population), dtype=np.int64)
+        # distances are rows x edges, chunk the rows so big populations stay bounded in memory
+        step = max(1, chunk_elements // max(1, len(weights)))
+        for start in range(0, len(population), step):
+            cells = population.cells[start:start + step].astype(np.int64)
+            pos_x = cells % population.board_size_x
+            pos_y = cells // population.board_size_x
+            distance = np.abs(pos_x[:, sources] - pos_x[:, targets]) + np.abs(pos_y[:, sources] - pos_y[:, targets])
+            cost = distance @ weights
+
+            occupied = population.occupancy_counts(start, start + step)
+            overlaps = (occupied * (occupied - 1) // 2).sum(axis=1)
+            scores[start:start + step] = cost + overlap_penelty * overlaps
+            if profiling.profiler.enabled:
+                profiling.profiler.count("fitness_evaluations", len(overlaps))
+                profiling.profiler.count("overlaps_penalized", int(np.count_nonzero(overlaps)))
+        return scores
 
     def sort_chromosomes_by_score(self):
-        self.chromosomes.sort(key=lambda d: self.calculate_sum_cost(d))
-        self.best_score = self.calculate_sum_cost(self.chromosomes[0])
-
-    def calculate_sum_cost(self, chromosome: Chromosome, overlap_penelty: int = 10000):
+        scores = self.calculate_scores()
+        order = np.argsort(scores, kind="stable")
+        self.population = self.population.take(order)
+        self.scores = scores[order]
+        self.best_score = int(self.scores[0])
+
+    def calculate_sum_cost(self, chromosome: Union[Chromosome, np.ndarray], overlap_penelty: int = 10000):
+        if isinstance(chromosome, np.ndarray):
+            return self.calculate_layout_cost(chromosome, overlap_penelty)
         return sum([x.calculate_cost(chromosome[x.source], chromosome[x.target]) for x in
                     self.connections]) + overlap_penelty * chromosome.get_number_of_overlaps()
 
+    def _distances(self, cell: int, cells: np.ndarray) -> np.ndarray:
+        return np.abs(cells % self.board_size_x - cell % self.board_size_x) + \
+            np.abs(cells // self.board_size_x - cell // self.board_size_x)
+
+    def _neighbour_cost(self, cells: list[int], machine: int, cell: int, skip: int = -1) -> int:
+        # flow cost of machine standing on cell against its neighbours, plain ints since neighbours are few
+        board_size_x = self.board_size_x
+        x, y = cell % board_size_x, cell // board_size_x
+        cost = 0
+        for neighbour, weight in self.adjacency[machine]:
+            if neighbour != skip:
+                other = cells[neighbour]
+                cost += weight * (abs(other % board_size_x - x) + abs(other // board_size_x - y))
+        return cost
+
+    def move_cost(self, cells: Union[list[int], np.ndarray], cost: int, machine: int, new_cell: int,
+                  occupied: Optional[Union[list[int], np.ndarray]] = None, overlap_penelty: int = 10000) -> int:
+        """
+        Cost of the layout after moving machine to new_cell, occupied is the number of machines on every cell
+        of the layout (counted from cells when not given). cells is fastest as a list.
+        """
+        if not isinstance(cells, list):
+            cells = cells.tolist()
+        old_cell = cells[machine]
+        if old_cell == new_cell:
+            return cost
+        cost += self._neighbour_cost(cells, machine, new_cell) - self._neighbour_cost(cells, machine, old_cell)
+        if occupied is None:
+            old_count, new_count = cells.count(old_cell), cells.count(new_cell)
+        else:
+            old_count, new_count = int(occupied[old_cell]), int(occupied[new_cell])
+        return cost + overlap_penelty * (new_count - (old_count - 1))
+
+    def swap_cost(self, cells: Union[list[int], np.ndarray], cost: int, machine1: int, machine2: int) -> int:
+        """
+        Cost of the layout after machine1 and machine2 exchange their cells, the overlaps do not change.
+        """
+        if not isinstance(cells, list):
+            cells = cells.tolist()
+        cell1, cell2 = cells[machine1], cells[machine2]
+        if cell1 == cell2:
+            return cost
+        # the distance between the swapped pair stays the same
+        return cost + self._neighbour_cost(cells, machine1, cell2, machine2) - \
+            self._neighbour_cost(cells, machine1, cell1, machine2) + \
+            self._neighbour_cost(cells, machine2, cell1, machine1) - \
+            self._neighbour_cost(cells, machine2, cell2, machine1)
+
+    def calculate_layout_cost(self, cells: np.ndarray, overlap_penelty: int = 10000):
+        population = Population(self.board_size_x, self.board_size_y, cells.reshape(1, -1))
+        return int(self.calculate_population_scores(population, overlap_penelty)[0])
+
     def dump_best_chromo(self):
         if self.best_score == 0:
             self.sort_chromosomes_by_score()
-        return json.dumps(self.chromosomes[0].__dict__, indent=None, separators=None, default=lambda o: o.__dict__, )
+        return dump_chromosome(self.population.chromosome(0))
 
     def next_generation(self):
         s = FLOSolution(None, None, self.board_size_x, self.board_size_y, self.number_of_chromosomes,
-                        self.generation + 1, 0)
-        s.connect = self.connections
+                        self.generation + 1, 0, self.fitness_cache)
+        s.instance = self.instance
+        s.weights = self.weights
+        s.adjacency = self.adjacency
+        s.evaluator = self.evaluator
         return s
 
+    def __getstate__(self):
+        # evaluators hold process pools, they are not saved with the solution
+        state = self.__dict__.copy()
+        state["evaluator"] = None
+        return state
+
     def __str__(self):
         if self.best_score == 0:
             self.sort_chromosomes_by_score()
@@ -120,23 +567,67 @@ class FLOSolution:
                f"Best Solution: {self.best_score}"
 
 
+def dump_chromosome(chromosome: Chromosome) -> str:
+    # the slotted classes have no __dict__, their slots are written as json objects
+    return json.dumps(chromosome, default=lambda o: {name: getattr(o, name) for name in o.__slots__})
+
+
+def build_adjacency(weights: SparseWeights) -> list[list[tuple[int, int]]]:
+    # adjacency[i] holds (neighbour, weight) pairs of i as plain ints for the scalar delta costs
+    indices, data = weights.indices.tolist(), weights.data.tolist()
+    indptr = weights.indptr.tolist()
+    return [list(zip(indices[indptr[i]:indptr[i + 1]], data[indptr[i]:indptr[i + 1]]))
+            for i in range(weights.number_of_machines)]
+
+
+def compile_instance(flow_json: list[dict], cost_json: list[dict], content_hash: str = "") -> CompiledInstance:
+    # flows with amount 0 cost nothing and are dropped, the machines are still counted from every flow entry
+    costs = {(e["source"], e["dest"]): e["cost"] for e in cost_json}
+    flows = [e for e in flow_json if e["amount"] != 0]
+    missing = [(e["source"], e["dest"]) for e in flows if (e["source"], e["dest"]) not in costs]
+    if missing:
+        raise ValueError(f"No cost for the flows {missing[:10]}")
+    number_of_machines = max([max(e["source"], e["dest"]) for e in flow_json], default=-1) + 1
+    return CompiledInstance(number_of_machines,
+                            np.array([e["source"] for e in flows], dtype=np.int64),
+                            np.array([e["dest"] for e in flows], dtype=np.int64),
+                            np.array([e["amount"] for e in flows], dtype=np.int64),
+                            np.array([costs[(e["source"], e["dest"])] for e in flows], dtype=np.int64),
+                            content_hash)
+
+
+def load_instance(flow_file_name: str, cost_file_name: str,
+                  cache_folder: Optional[str] = INSTANCE_CACHE_FOLDER) -> CompiledInstance:
+    """
+    Compiled instance of the flow/cost files. It is cached in cache_folder as an .npz named by the hash of the
+    content of both files, so an unchanged instance is parsed once for all runs using it. No cache without
+    cache_folder.
+    """
+    with open(flow_file_name, "rb") as flow_file:
+        flow_bytes = flow_file.read()
+    with open(cost_file_name, "rb") as cost_file:
+        cost_bytes = cost_file.read()
+    content_hash = hashlib.sha256(hashlib.sha256(flow_bytes).digest() + hashlib.sha256(cost_bytes).digest()) \
+        .hexdigest()
+    cache_file_name = os.path.join(cache_folder, f"{content_hash[:32]}.npz") if cache_folder is not None else None
+    if cache_file_name is not None and os.path.exists(cache_file_name):
+        try:
+            return CompiledInstance.load(cache_file_name, content_hash)
+        except (ValueError, OSError, KeyError) as e:
+            print(f"Recompiling instance, {e}")
+    instance = compile_instance(json.loads(flow_bytes), json.loads(cost_bytes), content_hash)
+    if cache_file_name is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        instance.save(cache_file_name)
+    return instance
+
+
 def load_machine_connections(flow_file_name: str, cost_file_name: str) -> list[FLOMachineConnection]:
-    with open(flow_file_name, "r", encoding="utf-8") as flow_file:
-        with open(cost_file_name, "r", encoding="utf-8") as cost_file:
-            flow_json = json.load(flow_file)
-            cost_json = json.load(cost_file)
-
-            def get_cost(source, dest):
-                for a in cost_json:
-                    if a["source"] == source and a["dest"] == dest:
-                        return a["cost"]
-                raise ValueError()
-
-            connections = []
-            for e in flow_json:
-                connections.append(
-                    FLOMachineConnection(e["source"], e["dest"], e["amount"], get_cost(e["source"], e["dest"])))
-            return connections
+    return load_instance(flow_file_name, cost_file_name).connections
+
+
+def preload_instance(flow_file_name: str, cost_file_name: str):
+    LOADED_INSTANCES[(flow_file_name, cost_file_name)] = load_instance(flow_file_name, cost_file_name)
 
 
 def test():
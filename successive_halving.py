@@ -0,0 +1,114 @@
+import math
+import os
+from multiprocessing import Pool
+from typing import Optional
+
+from genetic_operations import generate_random_solution
+from storage_data import FLOSolution
+from sweep_scheduler import parse_job_line, init_worker
+from run_log import TextResultSink
+from run_statistics import RunStatistics
+from traning_center import evolve_generation, output_file_name
+
+
+class HalvingRun:
+    """
+    One configuration of the sweep that can be trained a few generations at a time.
+    state is "running" until the run finishes its max_generations, converges or is pruned.
+    """
+
+    def __init__(self, line: str):
+        self.job = parse_job_line(line)
+        self.id = self.job["id"]
+        self.solution: Optional[FLOSolution] = None
+        self.last_solutions: list[int] = []
+        self.file_name: Optional[str] = None
+        self.best_score: Optional[int] = None
+        self.best_generation = 0
+        # last generation written to the output file
+        self.generations = 0
+        self.statistics = RunStatistics()
+        self.state = "running"
+
+    def __str__(self):
+        return f"{self.id};{self.job['method']};{self.generations};{self.best_score};{self.state}"
+
+
+def advance_run(run: HalvingRun, budget: int, flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                folder: str, patience: int = 0, result_sink=TextResultSink) -> HalvingRun:
+    job = run.job
+    if run.solution is None:
+        run.solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size,
+                                                job["number_of_chromosomes"])
+        run.file_name = output_file_name(job["method"], x_board_size, y_board_size, job["number_of_chromosomes"],
+                                         job["mutation_chance"], job["number_of_mutations"], job["cross_chance"],
+                                         job["max_generations"], job["sample_size"], f"_{run.id}",
+                                         result_sink.EXTENSION)
+    last_generation = min(budget, job["max_generations"])
+    with result_sink(os.path.join(folder, run.file_name), "a", statistics=run.statistics) as output:
+        while run.solution.generation <= last_generation:
+            run.solution.sort_chromosomes_by_score()
+            run.last_solutions.append(run.solution.best_score)
+            if len(run.last_solutions) > 10:
+                run.last_solutions.pop(0)
+            output.write_generation(run.solution, job["max_generations"])
+            run.generations = run.solution.generation
+            if run.best_score is None or run.solution.best_score < run.best_score:
+                run.best_score = run.solution.best_score
+                run.best_generation = run.solution.generation
+
+            if run.solution.generation == job["max_generations"]:
+                run.state = "finished"
+                break
+            if 0 < patience <= run.solution.generation - run.best_generation:
+                run.state = "converged"
+                break
+            run.solution = evolve_generation(run.solution, run.last_solutions, job["method"], job["mutation_chance"],
+                                             job["number_of_mutations"], job["cross_chance"], job["sample_size"])
+    # the cache is rebuilt in the next rung, shipping it between processes costs more than re-scoring
+    run.solution.fitness_cache.clear()
+    return run
+
+
+def run_successive_halving(gens_file_name: str, flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+                           folder: str, min_generations: int = 10, eta: int = 3, patience: int = 30,
+                           processes: Optional[int] = None, result_sink=TextResultSink) -> list[HalvingRun]:
+    """
+    Successive halving over the configurations of gens_file_name (the all_gens.txt format). Every configuration is
+    trained for min_generations, then only the best 1 / eta of them continue with eta times the budget, until all
+    remaining runs reach their own max_generations. Runs that did not improve for patience generations stop early.
+    Every run is logged to its output_*.txt file as far as it got, a summary goes to halving_summary.txt.
+    """
+    processes = processes if processes is not None else os.cpu_count()
+    os.makedirs(os.path.join(folder, "finished"), exist_ok=True)
+    with open(gens_file_name, "r", encoding="utf-8") as input_file:
+        runs = [HalvingRun(e.strip()) for e in input_file if e.strip() != ""]
+
+    active = runs
+    budget = min_generations
+    with Pool(processes, initializer=init_worker, initargs=(flow_name, cost_name)) as pool:
+        while active:
+            advanced = pool.starmap(advance_run, [(run, budget, flow_name, cost_name, x_board_size, y_board_size,
+                                                   folder, patience, result_sink) for run in active])
+            runs_by_id = {run.id: run for run in advanced}
+            runs = [runs_by_id.get(run.id, run) for run in runs]
+
+            still_running = sorted([run for run in advanced if run.state == "running"], key=lambda d: d.best_score)
+            keep = math.ceil(len(still_running) / eta)
+            for run in still_running[keep:]:
+                run.state = "pruned"
+            active = still_running[:keep]
+            print(f"Budget {budget}: {len(advanced)} runs trained, {len(active)} promoted")
+            budget *= eta
+
+    with open(os.path.join(folder, "halving_summary.txt"), "w", encoding="utf-8") as output:
+        output.write("id;method;generations;best_score;state\n")
+        for run in runs:
+            output.write(f"{run}\n")
+            with open(os.path.join(folder, "finished", f"{run.id}.finished"), "w") as out:
+                out.close()
+    return runs
+
+
+if __name__ == '__main__':
+    run_successive_halving("all_gens.txt", "dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, "hard\\halving")
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import time
+import traceback
+from datetime import timedelta
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from storage_data import preload_instance
+from traning_center import start_training_with_roulette, start_training_with_tournament
+
+JOB_TABLE = "sweep_jobs.db"
+
+
+def open_job_table(file_name: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(file_name)
+    connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                       "id INTEGER PRIMARY KEY, "
+                       "line TEXT NOT NULL, "
+                       "state TEXT NOT NULL DEFAULT 'pending', "
+                       "attempts INTEGER NOT NULL DEFAULT 0, "
+                       "error TEXT, "
+                       "duration REAL)")
+    return connection
+
+
+def import_jobs(connection: sqlite3.Connection, gens_file_name: str = "all_gens.txt",
+                finished_folder: Optional[str] = None):
+    with open(gens_file_name, "r", encoding="utf-8") as input_file:
+        jobs = [(int(e.split(";")[0]), e.strip()) for e in input_file if e.strip() != ""]
+    connection.executemany("INSERT OR IGNORE INTO jobs (id, line) VALUES (?, ?)", jobs)
+    if finished_folder is not None and os.path.isdir(finished_folder):
+        # runs completed before the job table existed only left {id}.finished markers
+        finished = [(int(e.split(".")[0]),) for e in os.listdir(finished_folder) if e.endswith(".finished")]
+        connection.executemany("UPDATE jobs SET state = 'done' WHERE id = ?", finished)
+    # jobs still marked running belong to a sweep that was killed
+    connection.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+    connection.commit()
+
+
+def parse_job_line(line: str) -> dict:
+    # f"{id};t;{max_generations};{chromosomes};{mutations / 1000};{mutation_count};{cross_chance};{tournament_size / 10};\n")
+    split = line.split(";")
+    return {"id": int(split[0]), "method": split[1], "max_generations": int(split[2]),
+            "number_of_chromosomes": int(split[3]), "mutation_chance": float(split[4]),
+            "number_of_mutations": int(split[5]), "cross_chance": int(split[6]) / 10,
+            "sample_size": float(split[7]) if split[1] == "t" else 0.0}
+
+
+def init_worker(flow_name: str, cost_name: str):
+    preload_instance(flow_name, cost_name)
+
+
+def run_job(line: str, flow_name: str, cost_name: str, x_board_size: int, y_board_size: int, folder: str):
+    job_id = int(line.split(";")[0])
+    started = time.time()
+    try:
+        job = parse_job_line(line)
+        if job["method"] == "r":
+            start_training_with_roulette(flow_name, cost_name, x_board_size, y_board_size,
+                                         job["number_of_chromosomes"], 1, job["mutation_chance"],
+                                         job["number_of_mutations"], job["cross_chance"], job["max_generations"],
+                                         False, folder, job_id)
+        else:
+            start_training_with_tournament(flow_name, cost_name, x_board_size, y_board_size,
+                                           job["number_of_chromosomes"], 1, job["mutation_chance"],
+                                           job["number_of_mutations"], job["sample_size"], job["cross_chance"],
+                                           job["max_generations"], False, folder, job_id)
+    except Exception:
+        return job_id, traceback.format_exc(), time.time() - started
+    return job_id, None, time.time() - started
+
+
+def run_sweep(gens_file_name: str, flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
+              folder: str, processes: Optional[int] = None, max_retries: int = 2, retry_failed: bool = False,
+              job_table: Optional[str] = None):
+    """
+    Runs every configuration of gens_file_name (the all_gens.txt format) that is not done yet. The job table
+    (sqlite, folder/sweep_jobs.db by default) keeps the state, attempts and last error of every job, so a killed
+    sweep resumes where it stopped. Failed jobs are retried max_retries times, retry_failed gives jobs that ran out
+    of retries in an earlier sweep another chance. A worker process dying fails the jobs running at that moment
+    and the pool is started again.
+    """
+    processes = processes if processes is not None else os.cpu_count()
+    os.makedirs(os.path.join(folder, "finished"), exist_ok=True)
+    connection = open_job_table(job_table if job_table is not None else os.path.join(folder, JOB_TABLE))
+    import_jobs(connection, gens_file_name, os.path.join(folder, "finished"))
+    if retry_failed:
+        connection.execute("UPDATE jobs SET state = 'pending', attempts = 0 WHERE state = 'failed'")
+    jobs = connection.execute("SELECT id, line FROM jobs WHERE state = 'pending' ORDER BY id").fetchall()
+    lines = dict(jobs)
+    print(f"Sweep: {len(jobs)} jobs to run on {processes} processes")
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(processes, initializer=init_worker, initargs=(flow_name, cost_name))
+
+    pool = new_pool()
+    waiting = [job_id for job_id, _ in jobs]
+    running: dict[Future, int] = {}
+
+    def submit(job_id: int):
+        connection.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1 WHERE id = ?", (job_id,))
+        running[pool.submit(run_job, lines[job_id], flow_name, cost_name, x_board_size, y_board_size,
+                            folder)] = job_id
+
+    started = time.time()
+    remaining = len(jobs)
+    done = 0
+    failed = 0
+    try:
+        while remaining > 0:
+            # only as many jobs as processes are handed out, a dying worker breaks the pool and fails every job in it
+            while waiting and len(running) < processes:
+                submit(waiting.pop(0))
+            connection.commit()
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in finished):
+                # every job of a broken pool fails, all of them are collected before a new pool takes jobs
+                finished = wait(running)[0]
+                pool.shutdown(wait=False)
+                pool = new_pool()
+            for future in finished:
+                job_id = running.pop(future)
+                try:
+                    job_id, error, duration = future.result()
+                except BrokenProcessPool:
+                    error = "Worker process died (killed or crashed)"
+                except Exception as e:
+                    error = repr(e)
+                if error is None:
+                    connection.execute("UPDATE jobs SET state = 'done', error = NULL, duration = ? WHERE id = ?",
+                                       (duration, job_id))
+                    done += 1
+                    remaining -= 1
+                else:
+                    print(f"Job {job_id} failed:\n{error}")
+                    attempts = connection.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+                    connection.execute("UPDATE jobs SET state = 'pending', error = ? WHERE id = ?", (error, job_id))
+                    if attempts <= max_retries:
+                        waiting.append(job_id)
+                    else:
+                        connection.execute("UPDATE jobs SET state = 'failed' WHERE id = ?", (job_id,))
+                        failed += 1
+                        remaining -= 1
+            connection.commit()
+
+            elapsed = time.time() - started
+            throughput = (done + failed) / elapsed if elapsed > 0 else 0
+            eta = timedelta(seconds=int(remaining / throughput)) if throughput > 0 else "?"
+            print(f"Sweep: {done} done, {failed} failed, {remaining} left, {throughput * 60:.1f} jobs/min, ETA {eta}")
+    finally:
+        pool.shutdown(cancel_futures=True)
+    connection.close()
+
+
+if __name__ == '__main__':
+    run_sweep("all_gens.txt", "dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, "hard\\automat")
@@ -2,9 +2,16 @@ import os
 import pickle
 import statistics
 from datetime import datetime
-from multiprocessing import Pool
+from typing import Optional
 
-from genetic_operations import generate_random_solution, roulette, cross, mutation, selection_tournament
+import profiling
+
+from bounds import lower_bound, reached_target
+from random_baseline import sample_random_baseline
+from genetic_operations import generate_random_solution, roulette, cross, mutation, selection_tournament, \
+    select_roulette, select_tournament, cross_pairs
+from checkpoint import checkpoint_path, read_checkpoint, write_checkpoint
+from run_log import TextResultSink
 from storage_data import FLOSolution
 
 RESULTS_FOLDER = "results"
@@ -20,51 +27,144 @@ def load_data(file_name: str = "copy.bin"):
         return pickle.load(file)
 
 
+def load_existing(flow_name: str, cost_name: str, folder: str, id=0) -> tuple[FLOSolution, list[int]]:
+    # the run's own checkpoint when there is one, otherwise the old pickled copy.bin
+    if os.path.exists(checkpoint_path(folder, id)):
+        solution, header = read_checkpoint(checkpoint_path(folder, id), flow_name, cost_name)
+        print(f"Resuming {id} from generation {solution.generation}")
+        return solution, header["last_solutions"]
+    return load_data(), []
+
+
+def output_file_name(method: str, x_board_size: int, y_board_size: int, number_of_chromosomes: int,
+                     mutation_chance: float, number_of_mutations: int, cross_chance: float, max_generations: int = 0,
+                     sample_size: float = 0.0, suffix: str = "", extension: str = ".txt") -> str:
+    # fields after the last parameter (suffix) are ignored by data_processing.load_file
+    if method == "t":
+        return f"output_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_tournament_{x_board_size}_{y_board_size}_{number_of_chromosomes}_{mutation_chance}_{number_of_mutations}_{max_generations}_{cross_chance}_{sample_size}{suffix}{extension}"
+    return f"output_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_roulette_{x_board_size}_{y_board_size}_{number_of_chromosomes}_{mutation_chance}_{number_of_mutations}_{cross_chance}{suffix}{extension}"
+
+
+def evolve_generation(current_solution: FLOSolution, last_solutions: list[int], method: str, mutation_chance: float,
+                      number_of_mutations: int, cross_chance: float, sample_size: float = 0.0,
+                      parent_pairs: bool = False) -> FLOSolution:
+    """
+    Selection, cross and mutation of one generation, method is "r" for roulette and "t" for tournament.
+    last_solutions are the best scores of the last generations used to detect stagnation.
+    """
+    number_of_chromosomes = current_solution.number_of_chromosomes
+    profiler = profiling.profiler
+    if method == "r":
+        if parent_pairs:
+            with profiler.phase("selection"):
+                pairs = select_roulette(current_solution.calculate_scores(), (number_of_chromosomes, 2))
+            with profiler.phase("cross"):
+                current_solution = cross_pairs(current_solution, pairs, cross_chance)
+        else:
+            with profiler.phase("selection"):
+                results = roulette(current_solution, number_of_results=2)
+            # print(str(current_solution.calculate_sum_cost(results[0])) + " " + str(
+            #     current_solution.calculate_sum_cost(results[1])))
+            with profiler.phase("cross"):
+                current_solution = cross(current_solution, results, cross_chance)
+    else:
+        if parent_pairs:
+            with profiler.phase("selection"):
+                pairs = select_tournament(current_solution.calculate_scores(), (number_of_chromosomes, 2),
+                                          sample_size)
+            with profiler.phase("cross"):
+                current_solution = cross_pairs(current_solution, pairs, cross_chance)
+        else:
+            with profiler.phase("selection"):
+                results = selection_tournament(current_solution, sample_size, number_of_results=2)
+            with profiler.phase("cross"):
+                current_solution = cross(current_solution, results, cross_chance)
+        with profiler.phase("sort"):
+            current_solution.sort_chromosomes_by_score()
+    with profiler.phase("mutation"):
+        if statistics.mean(last_solutions) == current_solution.best_score:
+            print("Stagnation!")
+            mutation(current_solution, mutation_chance * 2, number_of_mutations * 2)
+        else:
+            mutation(current_solution, mutation_chance, number_of_mutations)
+    return current_solution
+
+
+def record_generation(current_solution: FLOSolution, last_solutions: list[int], output, max_generations: int,
+                      checkpoint_file_name: Optional[str] = None, checkpoint_every: int = 0, config: dict = None,
+                      local_search=None):
+    # everything the training loops do with a generation before evolving it
+    profiler = profiling.profiler
+    with profiler.phase("sort"):
+        current_solution.sort_chromosomes_by_score()
+    # optional object with due(generation) and apply(solution), see local_search.LocalSearch
+    if local_search is not None and local_search.due(current_solution.generation):
+        with profiler.phase("local_search"):
+            profiler.count("improved_by_local_search", local_search.apply(current_solution))
+    if checkpoint_file_name is not None and current_solution.generation % checkpoint_every == 0:
+        with profiler.phase("checkpoint"):
+            write_checkpoint(current_solution, checkpoint_file_name, config, last_solutions)
+    last_solutions.append(current_solution.best_score)
+    if len(last_solutions) > 10:
+        last_solutions.pop(0)
+    with profiler.phase("io"):
+        output.write_generation(current_solution, max_generations)
+
+
+def start_bound(current_solution: FLOSolution, output, target_gap: Optional[float]) -> Optional[int]:
+    # lower bound the loops stop at, or within target_gap of, None without target_gap
+    if target_gap is None:
+        return None
+    bound, optimal = lower_bound(current_solution)
+    output.statistics.lower_bound = bound
+    print(f"Lower bound {bound}{' (optimum)' if optimal else ''}, stopping at a gap of {target_gap}")
+    return bound
+
+
 def start_training_with_roulette(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
                                  number_of_chromosomes: int,
                                  number_of_cuts_per_chromosome: int, mutation_chance: float, number_of_mutations: int,
                                  cross_chance: float,
                                  max_generations: int = 0, load_existing_generation: int = False,
-                                 folder: str = RESULTS_FOLDER, id=0):
+                                 folder: str = RESULTS_FOLDER, id=0, parent_pairs: bool = False, evaluator=None,
+                                 checkpoint_every: int = 0, result_sink=TextResultSink, profile: Optional[str] = None,
+                                 profile_memory: bool = False, local_search=None,
+                                 target_gap: Optional[float] = None):
     print(
         f"Training soluion for {x_board_size}x{y_board_size} with {number_of_chromosomes} {mutation_chance} {number_of_mutations}")
+    config = {"method": "r", "flow_name": flow_name, "cost_name": cost_name, "mutation_chance": mutation_chance,
+              "number_of_mutations": number_of_mutations, "cross_chance": cross_chance,
+              "max_generations": max_generations, "id": id}
     if not load_existing_generation:
         current_solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size,
                                                     number_of_chromosomes)
+        last_solutions = []
     else:
-        current_solution = load_data()
-    last_solutions = []
+        current_solution, last_solutions = load_existing(flow_name, cost_name, folder, id)
+    current_solution.evaluator = evaluator
 
     # print(current_solution.max_id())
-    with open(os.path.join(folder,
-                           f"output_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_roulette_{x_board_size}_{y_board_size}_{number_of_chromosomes}_{mutation_chance}_{number_of_mutations}_{cross_chance}.txt"),
-              "w", encoding="utf-8") as output:
-        try:
-            while max_generations == 0 or current_solution.generation <= max_generations:
-                current_solution.sort_chromosomes_by_score()
-                last_solutions.append(current_solution.best_score)
-                if len(last_solutions) > 10:
-                    last_solutions.pop(0)
-                if current_solution.generation % 10 == 0 or current_solution.generation == max_generations:
-                    print(current_solution)
-                    output.write(
-                        f"{current_solution.generation};{current_solution.best_score};{current_solution.dump_best_chromo()}\n")
-                    output.flush()
-                else:
-                    output.write(f"{current_solution.generation};{current_solution.best_score}\n")
-
-                results = roulette(current_solution, number_of_results=2)
-                # print(str(current_solution.calculate_sum_cost(results[0])) + " " + str(
-                #     current_solution.calculate_sum_cost(results[1])))
-                current_solution = cross(current_solution, results, cross_chance)
-                if statistics.mean(last_solutions) == current_solution.best_score:
-                    print("Stagnation!")
-                    mutation(current_solution, mutation_chance * 2, number_of_mutations * 2)
-                else:
-                    mutation(current_solution, mutation_chance, number_of_mutations)
-        except Exception as e:
-            print(e)
-            output.close()
+    with result_sink(os.path.join(folder, output_file_name("r", x_board_size, y_board_size, number_of_chromosomes,
+                                                           mutation_chance, number_of_mutations, cross_chance,
+                                                           extension=result_sink.EXTENSION))) as output:
+        # the bound is computed before profiling starts, it is no part of the first generation
+        bound = start_bound(current_solution, output, target_gap)
+        with profiling.profile_run(profile, profile_memory):
+            try:
+                while max_generations == 0 or current_solution.generation <= max_generations:
+                    record_generation(current_solution, last_solutions, output, max_generations,
+                                      checkpoint_path(folder, id) if checkpoint_every > 0 else None,
+                                      checkpoint_every, config, local_search)
+                    if bound is not None and reached_target(current_solution.best_score, bound, target_gap):
+                        break
+                    current_solution = evolve_generation(current_solution, last_solutions, "r", mutation_chance,
+                                                         number_of_mutations, cross_chance,
+                                                         parent_pairs=parent_pairs)
+                    profiling.profiler.end_generation(current_solution.generation - 1, current_solution)
+            except Exception as e:
+                print(e)
+                output.close()
+                raise
     print(f"Finished training at generation {current_solution.generation} with score {current_solution.best_score}")
     with open(os.path.join(folder, "finished", f"{id}.finished"), "w") as out:
         out.close()
@@ -74,41 +174,39 @@ def start_training_with_tournament(flow_name: str, cost_name: str, x_board_size:
                                    number_of_chromosomes: int,
                                    number_of_cuts_per_chromosome: int, mutation_chance: float, number_of_mutations: int,
                                    sample_size: float, cross_chance: float, max_generations: int = -1,
-                                   load_existing_generation: bool = False, results_folder: str = RESULTS_FOLDER, id=0):
+                                   load_existing_generation: bool = False, results_folder: str = RESULTS_FOLDER, id=0,
+                                   parent_pairs: bool = False, evaluator=None, checkpoint_every: int = 0,
+                                   result_sink=TextResultSink, profile: Optional[str] = None,
+                                   profile_memory: bool = False, local_search=None,
+                                   target_gap: Optional[float] = None):
+    config = {"method": "t", "flow_name": flow_name, "cost_name": cost_name, "mutation_chance": mutation_chance,
+              "number_of_mutations": number_of_mutations, "sample_size": sample_size, "cross_chance": cross_chance,
+              "max_generations": max_generations, "id": id}
     if not load_existing_generation:
         current_solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size,
                                                     number_of_chromosomes)
+        last_solutions = []
     else:
-        current_solution = load_data()
-    last_solutions = []
-    with open(os.path.join(results_folder,
-                           f"output_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_tournament_{x_board_size}_{y_board_size}_{number_of_chromosomes}_{mutation_chance}_{number_of_mutations}_{max_generations}_{cross_chance}_{sample_size}.txt"),
-              "w", encoding="utf-8") as output:
-        while max_generations == -1 or current_solution.generation <= max_generations:
-            current_solution.sort_chromosomes_by_score()
-            last_solutions.append(current_solution.best_score)
-            if len(last_solutions) > 10:
-                last_solutions.pop(0)
-
-            if current_solution.generation % 10 == 0 or current_solution.generation == max_generations:
-                print(current_solution)
-                output.write(
-                    f"{current_solution.generation};{current_solution.best_score};{current_solution.dump_best_chromo()}\n")
-                output.flush()
-            else:
-                output.write(f"{current_solution.generation};{current_solution.best_score}\n")
-            # best_chromo = current_solution.chromosomes[0]
-            # show_machines(current_solution, best_chromo)
-            results = selection_tournament(current_solution, sample_size, number_of_results=2)
-            # print(str(current_solution.calculate_sum_cost(results[0])) + " " + str(
-            #     current_solution.calculate_sum_cost(results[1])))
-            current_solution = cross(current_solution, results, cross_chance)
-            current_solution.sort_chromosomes_by_score()
-            if statistics.mean(last_solutions) == current_solution.best_score:
-                print("Stagnation!")
-                mutation(current_solution, mutation_chance * 2, number_of_mutations * 2)
-            else:
-                mutation(current_solution, mutation_chance, number_of_mutations)
+        current_solution, last_solutions = load_existing(flow_name, cost_name, results_folder, id)
+    current_solution.evaluator = evaluator
+    with result_sink(os.path.join(results_folder,
+                                  output_file_name("t", x_board_size, y_board_size, number_of_chromosomes,
+                                                   mutation_chance, number_of_mutations, cross_chance,
+                                                   max_generations, sample_size,
+                                                   extension=result_sink.EXTENSION))) as output:
+        bound = start_bound(current_solution, output, target_gap)
+        with profiling.profile_run(profile, profile_memory):
+            while max_generations == -1 or current_solution.generation <= max_generations:
+                record_generation(current_solution, last_solutions, output, max_generations,
+                                  checkpoint_path(results_folder, id) if checkpoint_every > 0 else None,
+                                  checkpoint_every, config, local_search)
+                if bound is not None and reached_target(current_solution.best_score, bound, target_gap):
+                    break
+                # best_chromo = current_solution.chromosomes[0]
+                # show_machines(current_solution, best_chromo)
+                current_solution = evolve_generation(current_solution, last_solutions, "t", mutation_chance,
+                                                     number_of_mutations, cross_chance, sample_size, parent_pairs)
+                profiling.profiler.end_generation(current_solution.generation - 1, current_solution)
     with open(os.path.join(results_folder, "finished", f"{id}.finished"), "w") as out:
         out.close()
         pass
@@ -119,15 +217,8 @@ pass
 
 def generate_random_tournament(flow_name: str, cost_name: str, x_board_size: int, y_board_size: int,
                                number_of_randoms=10000, folder="results\\random"):
-    with open(os.path.join(folder,
-                           f"random_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{x_board_size}_{y_board_size}.txt"),
-              "w", encoding="utf-8") as output:
-        for i in range(number_of_randoms):
-            current_solution = generate_random_solution(flow_name, cost_name, x_board_size, y_board_size, 1)
-            current_solution.sort_chromosomes_by_score()
-            output.write(
-                f"{i};{current_solution.best_score};{current_solution.dump_best_chromo()}\n")
-            output.flush()
+    # random baseline of the instance, see random_baseline.sample_random_baseline
+    return sample_random_baseline(flow_name, cost_name, x_board_size, y_board_size, number_of_randoms, folder=folder)
 
 
 def load(input_file_name="input.txt"):
@@ -162,27 +253,9 @@ if __name__ == '__main__':
 
     # threading.Thread(daemon=True, target=save_thread).start()
 
-    with Pool(6) as p:
-        with open("all_gens.txt", "r", encoding="utf-8") as input_file:
-            for e in input_file.readlines():
-                split = e.split(";")
-                if not os.path.exists(os.path.join("hard\\automat\\finished", f"{split[0]}.finished")):
-                    if split[1] == "r":
-                        # f"{id};t;{max_generations};{chromosomes};{mutations / 1000};{mutation_count};{cross_chance};{tournament_size / 10};\n")
-                        p.apply_async(start_training_with_roulette,
-                                      ["dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, int(split[3]), 1,
-                                       float(split[4]), int(split[5]), int(split[6]) / 10, int(split[2]), False,
-                                       "hard\\automat", int(split[0])])
-                    else:
-                        p.apply_async(start_training_with_tournament,
-                                      ["dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, int(split[3]), 1,
-                                       float(split[4]), int(split[5]), float(split[7]), int(split[6]) / 10,
-                                       int(split[2]), False,
-                                       "hard\\automat", int(split[0])])
-                else:
-                    print(f"{split[0]} exists!")
-        p.close()
-        p.join()
+    from sweep_scheduler import run_sweep
+
+    run_sweep("all_gens.txt", "dane\\hard_flow.json", "dane\\hard_cost.json", 5, 6, "hard\\automat")
 
     exit(0)
     with open("all_gens.txt", "w", encoding="utf-8") as output: